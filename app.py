@@ -2,7 +2,9 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from config import create_indexes
 from routes import users, questionnaires, virtual_accounts, transactions, scheduled_payments, insights, predictions, chat
-from services.scheduler import start_background_tasks
+from services.scheduler import start_background_tasks, stop_background_tasks
+from services.ml_service import ml_service
+from services.agent_events import agent_events
 
 # Create database indexes on startup
 @asynccontextmanager
@@ -10,8 +12,12 @@ async def lifespan(app: FastAPI):
     # Startup: Load environment variables and create indexes
     create_indexes()
     start_background_tasks()
+    ml_service.start_model_watcher()
+    agent_events.start()
     yield
     # Shutdown: Clean up resources (if needed)
+    stop_background_tasks()
+    agent_events.stop()
 
 app = FastAPI(
     title="SafeBalance API",
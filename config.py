@@ -9,8 +9,8 @@ load_dotenv()
 # MongoDB Atlas connection
 MONGODB_URI = os.getenv("MONGO_URL")
 print(MONGODB_URI)
-# Create synchronous PyMongo client
-client = MongoClient(MONGODB_URI, server_api=ServerApi('1'))
+# Create synchronous PyMongo client; BSON dates are read back as aware UTC datetimes
+client = MongoClient(MONGODB_URI, server_api=ServerApi('1'), tz_aware=True)
 db = client["safebalance_db"]
 
 # Collections
@@ -20,18 +20,50 @@ virtual_accounts_collection = db["virtual_accounts"]
 transactions_collection = db["transactions"]
 scheduled_payments_collection = db["scheduled_payments"]
 insights_collection = db["insights"]
+income_features_collection = db["income_features"]
+risk_scores_collection = db["risk_scores"]
+job_checkpoints_collection = db["job_checkpoints"]
+leases_collection = db["scheduler_leases"]
+agent_events_collection = db["agent_events"]
 
 # Create indexes for better query performance
-def create_indexes():
-    """Create database indexes"""
-    users_collection.create_index([("phone", ASCENDING)], unique=True)
-    users_collection.create_index([("aadhaar", ASCENDING)], unique=True)
-    virtual_accounts_collection.create_index([("user_id", ASCENDING)])
-    transactions_collection.create_index([("acct_id", ASCENDING)])
-    transactions_collection.create_index([("datetime", DESCENDING)])
-    scheduled_payments_collection.create_index([("user_id", ASCENDING)])
-    questionnaires_collection.create_index([("user_id", ASCENDING)])
-    insights_collection.create_index([("user_id", ASCENDING)])
-    insights_collection.create_index([("created_at", DESCENDING)])
-    insights_collection.create_index([("read", ASCENDING)])
+# Compound indexes follow the query shapes that use them (equality fields,
+# then sort fields, then ranges); utils/query_plans.py checks every query
+# shape against them with explain(). Only ever adds indexes; indexes they
+# replace are dropped by utils/drop_superseded_indexes.py once deployed
+def create_indexes(database=None):
+    """Create database indexes (on the app database unless one is given)"""
+    if database is None:
+        database = db
+    database["users"].create_index([("phone", ASCENDING)], unique=True)
+    database["users"].create_index([("aadhaar", ASCENDING)], unique=True)
+    database["virtual_accounts"].create_index([("user_id", ASCENDING)])
+    # Deposits per account since a cutoff (services.income_features.aggregate_deposits/_totals)
+    database["transactions"].create_index([("acct_id", ASCENDING), ("type", ASCENDING), ("datetime", ASCENDING)])
+    # An account's history, newest first, and its keyset pages (see utils.helpers.keyset_page)
+    database["transactions"].create_index([("acct_id", ASCENDING), ("datetime", DESCENDING), ("_id", DESCENDING)])
+    # A user's payments, and their high importance ones due in a window
+    database["scheduled_payments"].create_index([("user_id", ASCENDING), ("importance", ASCENDING), ("next_due", ASCENDING)])
+    # Reminder engine horizon (importance + next_due) and advance_due_dates (next_due)
+    database["scheduled_payments"].create_index([("importance", ASCENDING), ("next_due", ASCENDING)])
+    database["scheduled_payments"].create_index([("next_due", ASCENDING)])
+    database["questionnaires"].create_index([("user_id", ASCENDING)])
+    # A user's insights newest first, all or unread only (routes/insights)
+    database["insights"].create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    database["insights"].create_index(
+        [("user_id", ASCENDING), ("read", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+    )
+    # Dedup key for generated insights (see AgentService._insert_insight)
+    database["insights"].create_index(
+        [("user_id", ASCENDING), ("type", ASCENDING), ("dedup_subject", ASCENDING), ("dedup_bucket", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"dedup_bucket": {"$exists": True}}
+    )
+    database["income_features"].create_index([("user_id", ASCENDING)])
+    database["job_checkpoints"].create_index([("run_id", ASCENDING)])
+    # Expired leases are cleaned up by MongoDB; acquisition never relies on it
+    database["scheduler_leases"].create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    # Durable agent events: lease renewal by owner, recovery of expired leases
+    database["agent_events"].create_index([("owner", ASCENDING)])
+    database["agent_events"].create_index([("expires_at", ASCENDING)])
     print("Database indexes created")
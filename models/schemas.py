@@ -2,9 +2,12 @@
 Pydantic models for request/response validation
 """
 from enum import Enum
-from typing import Optional
-from datetime import datetime, timezone
-from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+from datetime import date, datetime, timezone
+from pydantic import BaseModel, Field, PlainSerializer
+
+# Timestamps are stored as BSON dates and returned as ISO 8601 strings
+Timestamp = Annotated[datetime, PlainSerializer(lambda value: value.isoformat(), return_type=str, when_used="json")]
 
 # ============================================================================
 # Enums
@@ -59,6 +62,10 @@ class UserResponse(UserModel):
     class Config:
         populate_by_name = True
 
+class UserPage(BaseModel):
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+
 # ============================================================================
 # Questionnaire Models
 # ============================================================================
@@ -131,7 +138,7 @@ class TransactionModel(BaseModel):
     type: TransactionType
     merchant: Optional[str] = None
     source: TransactionSource
-    datetime: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    datetime: Timestamp = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     class Config:
         json_schema_extra = {
@@ -152,6 +159,19 @@ class TransactionResponse(TransactionModel):
     class Config:
         populate_by_name = True
 
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+class TransactionImportResponse(BaseModel):
+    imported: int
+    failed: int
+    errors: List[ImportRowError]
+
 # ============================================================================
 # Scheduled Payment Models
 # ============================================================================
@@ -161,7 +181,7 @@ class ScheduledPaymentModel(BaseModel):
     occurrence: Occurrence
     particulars: str = Field(..., min_length=1)
     importance: Importance
-    firstdate: str = Field(..., pattern=r"^\d{4}-\d{2}-\d{2}$")
+    firstdate: date
 
     class Config:
         json_schema_extra = {
@@ -177,6 +197,7 @@ class ScheduledPaymentModel(BaseModel):
 
 class ScheduledPaymentResponse(ScheduledPaymentModel):
     id: str = Field(alias="_id")
+    next_due: Optional[date] = None
 
     class Config:
         populate_by_name = True
@@ -202,10 +223,23 @@ class InsightModel(BaseModel):
     message: str
     action_suggestion: Optional[str] = None
     read: bool = False
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: Timestamp = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class InsightResponse(InsightModel):
     id: str = Field(alias="_id")
     
     class Config:
-        populate_by_name = True
\ No newline at end of file
+        populate_by_name = True
+
+class InsightPage(BaseModel):
+    items: List[InsightResponse]
+    next_cursor: Optional[str] = None
+
+# ============================================================================
+# Prediction Models
+# ============================================================================
+class BatchIncomeRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+class ModelReloadRequest(BaseModel):
+    version: Optional[str] = None
@@ -3,10 +3,9 @@ Chat interface endpoints
 """
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
-from config import virtual_accounts_collection, transactions_collection
 from services.nlp_service import nlp_service
-from services.agent_service import AgentService
-from models.schemas import TransactionType, TransactionSource
+from services.ledger import ledger, AccountNotFoundError, InsufficientBalanceError
+from models.schemas import TransactionSource
 from datetime import datetime, timezone
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -37,53 +36,34 @@ async def process_chat_message(chat: ChatMessage):
         )
     
     # 2. Execute Action (Create Transaction)
-    account = virtual_accounts_collection.find_one({"user_id": chat.user_id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Virtual account not found")
-    
-    acct_id = str(account["_id"])
-    
-    # Prepare transaction document
     tx_doc = {
-        "acct_id": acct_id,
         "amount": intent.amount,
         "details": f"Chat entry: {intent.category}",
         "type": intent.type,  # deposit or withdrawal
         "merchant": intent.merchant or intent.category,
         "source": TransactionSource.chat.value,
-        "datetime": datetime.now(timezone.utc).isoformat()
+        "datetime": datetime.now(timezone.utc)
     }
     
-    # Update balance logic
-    if intent.type == "deposit":
-        virtual_accounts_collection.update_one(
-            {"_id": account["_id"]},
-            {"$inc": {"balance": intent.amount}}
-        )
-    else:
-        if account["balance"] < intent.amount:
-             return ChatResponse(
-                response=f"⚠️ Transaction failed! Insufficient balance. You have ₹{account['balance']} but tried to spend ₹{intent.amount}.",
-                action_taken=False
-            )
-        virtual_accounts_collection.update_one(
-            {"_id": account["_id"]},
-            {"$inc": {"balance": -intent.amount}}
+    # Balance update and transaction insert in one ledger write; also
+    # triggers the agentic checks (risk, buffer, etc.) in the background
+    try:
+        tx_doc, _ = ledger.post({"user_id": chat.user_id}, tx_doc)
+    except AccountNotFoundError:
+        raise HTTPException(status_code=404, detail="Virtual account not found")
+    except InsufficientBalanceError as e:
+        return ChatResponse(
+            response=f"⚠️ Transaction failed! Insufficient balance. You have ₹{e.balance} but tried to spend ₹{intent.amount}.",
+            action_taken=False
         )
     
-    # Insert transaction
-    result = transactions_collection.insert_one(tx_doc)
-    
-    # 3. Trigger Agentic Checks (Risk, Buffer, etc.)
-    AgentService.check_balance_risk(chat.user_id)
-    
-    # 4. Formulate Response
+    # 3. Formulate Response
     verb = "received" if intent.type == "deposit" else "spent"
     emoji = "💰" if intent.type == "deposit" else "💸"
     
     return ChatResponse(
         response=f"{emoji} recorded! You {verb} ₹{intent.amount} on {intent.category}.",
         action_taken=True,
-        transaction_id=str(result.inserted_id),
+        transaction_id=tx_doc["_id"],
         data=intent.model_dump()
     )
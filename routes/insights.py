@@ -1,25 +1,40 @@
 """
 Insights management endpoints
 """
-from typing import List
-from fastapi import APIRouter, HTTPException
-from models.schemas import InsightResponse
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query
+from models.schemas import InsightResponse, InsightPage
 from config import insights_collection
-from utils.helpers import convert_objectid
+from utils.helpers import convert_objectid, keyset_page, MAX_PAGE_SIZE
 
 router = APIRouter(prefix="/insights", tags=["insights"])
 
-@router.get("/user/{user_id}", response_model=List[InsightResponse])
-def get_user_insights(user_id: str, unread_only: bool = False):
-    """Get insights for a user"""
+@router.get("/user/{user_id}", response_model=Union[List[InsightResponse], InsightPage])
+def get_user_insights(
+    user_id: str,
+    unread_only: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    Get insights for a user, newest first
+    Pass cursor (empty for the first page, then each page's next_cursor)
+    to page through older insights
+    """
     query = {"user_id": user_id}
     if unread_only:
         query["read"] = False
     
+    if cursor is not None:
+        insights, next_cursor = keyset_page(
+            insights_collection, query, [("created_at", -1), ("_id", -1)], cursor, limit
+        )
+        return {"items": [convert_objectid(insight) for insight in insights], "next_cursor": next_cursor}
+    
     insights = list(
         insights_collection.find(query)
         .sort("created_at", -1)
-        .limit(20)
+        .limit(limit)
     )
     return [convert_objectid(insight) for insight in insights]
 
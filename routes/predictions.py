@@ -1,9 +1,11 @@
 """
 ML Prediction endpoints
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from models.schemas import BatchIncomeRequest, ModelReloadRequest
 from services.agent_service import AgentService
-from services.ml_service import ml_service
+from services.ml_service import ml_service, ModelRegistryError
+from utils.helpers import require_admin_key
 
 router = APIRouter(prefix="/predictions", tags=["predictions"])
 
@@ -29,7 +31,8 @@ def get_income_prediction(user_id: str):
         "confidence_50th": 3200.50,  // Most likely scenario
         "confidence_95th": 4160.65,  // Optimistic scenario
         "uncertainty": 0.25,
-        "model_available": true
+        "model_available": true,
+        "model_version": "2025-11-29"
     }
     """
     try:
@@ -39,4 +42,51 @@ def get_income_prediction(user_id: str):
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to generate income prediction: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/income/batch")
+def get_income_predictions_batch(request: BatchIncomeRequest):
+    """
+    Get predicted income for many users in a single forest pass
+    Returns a mapping of user_id -> prediction (same shape as /income/{user_id})
+    """
+    try:
+        return ml_service.predict_weekly_income_batch(request.user_ids)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Failed to generate income predictions: {str(e)}"
+        )
+
+@router.get("/model")
+def get_model_status():
+    """Get the currently active model version"""
+    return {
+        "model_loaded": ml_service.model_loaded,
+        "model_version": ml_service.model_version
+    }
+
+@router.post("/model/reload", dependencies=[Depends(require_admin_key)])
+def reload_model(request: ModelReloadRequest):
+    """
+    Load a model version from the registry and swap it in atomically
+    Defaults to the version named by the registry's CURRENT pointer.
+    In-flight predictions finish on the previous version.
+    Requires the X-Admin-Key header.
+    
+    Only the worker process serving this request switches models. Other
+    workers switch when the registry's CURRENT file names the new version
+    (model watcher), so update CURRENT to roll a version out everywhere.
+    """
+    try:
+        version = ml_service.load_model(request.version)
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to load model: {str(e)}"
+        )
+    return {"status": "reloaded", "model_version": version}
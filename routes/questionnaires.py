@@ -5,6 +5,7 @@ from fastapi import APIRouter, HTTPException, status
 from models.schemas import QuestionnaireModel, QuestionnaireResponse
 from config import questionnaires_collection, users_collection
 from utils.helpers import convert_objectid, validate_objectid
+from services.ml_service import ml_service, resolve_archetype
 
 router = APIRouter(prefix="/questionnaires", tags=["questionnaires"])
 
@@ -17,8 +18,11 @@ def create_questionnaire(questionnaire: QuestionnaireModel):
         raise HTTPException(status_code=404, detail="User not found")
     
     q_dict = questionnaire.model_dump()
+    # Resolve the model archetype once here instead of on every prediction
+    q_dict["archetype"] = resolve_archetype(questionnaire.a1)
     result = questionnaires_collection.insert_one(q_dict)
     q_dict["_id"] = str(result.inserted_id)
+    ml_service.set_user_archetype(questionnaire.user_id, q_dict["archetype"])
     return q_dict
 
 @router.get("/user/{user_id}", response_model=QuestionnaireResponse)
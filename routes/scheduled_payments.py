@@ -1,11 +1,14 @@
 """
 Scheduled payment management endpoints
 """
+from datetime import datetime, timezone
 from typing import List
 from fastapi import APIRouter, HTTPException, status
 from models.schemas import ScheduledPaymentModel, ScheduledPaymentResponse
 from config import scheduled_payments_collection, users_collection
 from utils.helpers import convert_objectid, validate_objectid
+from services.payment_schedule import day_start, next_due_date
+from services.reminders import reminder_engine
 
 router = APIRouter(prefix="/scheduled_payments", tags=["scheduled_payments"])
 
@@ -18,8 +21,14 @@ def create_scheduled_payment(payment: ScheduledPaymentModel):
         raise HTTPException(status_code=404, detail="User not found")
     
     pay_dict = payment.model_dump()
+    # Dates are stored as BSON dates at UTC midnight
+    pay_dict["firstdate"] = day_start(payment.firstdate)
+    pay_dict["next_due"] = day_start(next_due_date(
+        payment.firstdate, pay_dict["occurrence"], datetime.now(timezone.utc).date()
+    ))
     result = scheduled_payments_collection.insert_one(pay_dict)
     pay_dict["_id"] = str(result.inserted_id)
+    reminder_engine.add_payment(pay_dict)
     return pay_dict
 
 @router.get("/user/{user_id}", response_model=List[ScheduledPaymentResponse])
@@ -34,3 +43,4 @@ def delete_scheduled_payment(payment_id: str):
     result = scheduled_payments_collection.delete_one({"_id": validate_objectid(payment_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Scheduled payment not found")
+    reminder_engine.remove_payment(payment_id)
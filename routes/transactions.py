@@ -1,50 +1,74 @@
 """
 Transaction management endpoints
 """
-from typing import List
-from fastapi import APIRouter, HTTPException, status
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from pymongo import DESCENDING
-from models.schemas import TransactionModel, TransactionResponse, TransactionType
-from config import transactions_collection, virtual_accounts_collection
-from utils.helpers import convert_objectid, validate_objectid
-from services.agent_service import AgentService
+from models.schemas import TransactionModel, TransactionResponse, TransactionPage, TransactionImportResponse
+from config import transactions_collection
+from utils.helpers import convert_objectid, validate_objectid, keyset_page, MAX_PAGE_SIZE
+from services.ledger import ledger, AccountNotFoundError, InsufficientBalanceError
+from services.transaction_import import TransactionImport, IMPORT_CHUNK_SIZE
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 @router.post("/", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
 def create_transaction(transaction: TransactionModel):
     """Create a new transaction"""
-    # Verify account exists
-    account = virtual_accounts_collection.find_one({"_id": validate_objectid(transaction.acct_id)})
-    if not account:
-        raise HTTPException(status_code=404, detail="Virtual account not found")
-    
-    # Update account balance
-    if transaction.type == TransactionType.deposit:
-        virtual_accounts_collection.update_one(
+    try:
+        tx_dict, _ = ledger.post(
             {"_id": validate_objectid(transaction.acct_id)},
-            {"$inc": {"balance": transaction.amount}}
-        )
-    else:  # withdrawal
-        if account["balance"] < transaction.amount:
-            raise HTTPException(status_code=400, detail="Insufficient balance")
-        virtual_accounts_collection.update_one(
-            {"_id": validate_objectid(transaction.acct_id)},
-            {"$inc": {"balance": -transaction.amount}}
+            transaction.model_dump()
         )
+    except AccountNotFoundError:
+        raise HTTPException(status_code=404, detail="Virtual account not found")
+    except InsufficientBalanceError:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
     
-    tx_dict = transaction.model_dump()
-    result = transactions_collection.insert_one(tx_dict)
-    tx_dict["_id"] = str(result.inserted_id)
-
-    user_id = account["user_id"]
-    AgentService.check_balance_risk(user_id)
-
     return tx_dict
 
-@router.get("/account/{acct_id}", response_model=List[TransactionResponse])
-def get_account_transactions(acct_id: str, skip: int = 0, limit: int = 50):
-    """Get all transactions for an account"""
+@router.post("/import", response_model=TransactionImportResponse)
+async def import_transactions(request: Request):
+    """
+    Bulk import transactions streamed as NDJSON (one object per line) or,
+    with Content-Type text/csv, as CSV with a header row
+    Invalid rows are skipped and reported by row number
+    """
+    job = TransactionImport(csv_format="csv" in request.headers.get("content-type", ""))
+    records = []
+    async for data in request.stream():
+        records.extend(job.split_records(data))
+        if len(records) >= IMPORT_CHUNK_SIZE:
+            # Database work runs off the event loop
+            await run_in_threadpool(job.feed_records, records)
+            records = []
+    records.extend(job.end_records())
+    await run_in_threadpool(job.feed_records, records)
+    return await run_in_threadpool(job.finish)
+
+@router.get("/account/{acct_id}", response_model=Union[List[TransactionResponse], TransactionPage])
+def get_account_transactions(
+    acct_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Get all transactions for an account, newest first
+    Pass cursor (empty for the first page, then each page's next_cursor)
+    for keyset pagination, which stays fast however far back the page is
+    """
+    if cursor is not None:
+        transactions, next_cursor = keyset_page(
+            transactions_collection,
+            {"acct_id": acct_id},
+            [("datetime", DESCENDING), ("_id", DESCENDING)],
+            cursor,
+            limit
+        )
+        return {"items": [convert_objectid(tx) for tx in transactions], "next_cursor": next_cursor}
+    
     transactions = list(
         transactions_collection.find({"acct_id": acct_id})
         .sort("datetime", DESCENDING)
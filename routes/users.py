@@ -1,11 +1,12 @@
 """
 User management endpoints
 """
-from typing import List
-from fastapi import APIRouter, HTTPException, status
-from models.schemas import UserModel, UserResponse
+from typing import List, Optional, Union
+from fastapi import APIRouter, HTTPException, Query, status
+from pymongo import ASCENDING
+from models.schemas import UserModel, UserResponse, UserPage
 from config import users_collection
-from utils.helpers import convert_objectid, validate_objectid
+from utils.helpers import convert_objectid, validate_objectid, keyset_page, MAX_PAGE_SIZE
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -34,9 +35,21 @@ def get_user(user_id: str):
         raise HTTPException(status_code=404, detail="User not found")
     return convert_objectid(user)
 
-@router.get("/", response_model=List[UserResponse])
-def list_users(skip: int = 0, limit: int = 10):
-    """List all users with pagination"""
+@router.get("/", response_model=Union[List[UserResponse], UserPage])
+def list_users(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    List all users with pagination
+    Pass cursor (empty for the first page, then each page's next_cursor)
+    for keyset pagination instead of skip
+    """
+    if cursor is not None:
+        users, next_cursor = keyset_page(users_collection, {}, [("_id", ASCENDING)], cursor, limit)
+        return {"items": [convert_objectid(user) for user in users], "next_cursor": next_cursor}
+    
     users = list(users_collection.find().skip(skip).limit(limit))
     return [convert_objectid(user) for user in users]
 
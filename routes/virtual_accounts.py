@@ -5,6 +5,7 @@ from fastapi import APIRouter, HTTPException, status
 from models.schemas import VirtualAccountModel, VirtualAccountResponse
 from config import virtual_accounts_collection, users_collection
 from utils.helpers import convert_objectid, validate_objectid
+from services.income_features import income_features
 
 router = APIRouter(prefix="/virtual_accounts", tags=["virtual_accounts"])
 
@@ -24,6 +25,7 @@ def create_virtual_account(account: VirtualAccountModel):
     acct_dict = account.model_dump()
     result = virtual_accounts_collection.insert_one(acct_dict)
     acct_dict["_id"] = str(result.inserted_id)
+    income_features.seed_account(acct_dict["_id"], account.user_id)
     return acct_dict
 
 @router.get("/user/{user_id}", response_model=VirtualAccountResponse)
@@ -0,0 +1,168 @@
+"""
+Background queue for post-write agent checks
+Routes publish an "account changed" event after a write and return
+immediately; a dispatcher thread runs the balance risk check on a small
+thread pool once the user's coalescing window closes, so a burst of
+transactions for one user triggers a single check.
+
+The queue is bounded: when it is full the check runs inline, slowing the
+writer down instead of dropping the event. With AGENT_EVENTS_DURABLE set,
+pending events are also stored in MongoDB under a lease held by the
+process that queued them; the owner keeps renewing it, and any process
+claims events whose lease expired (their owner died) and runs them.
+"""
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from threading import Condition, Thread
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from config import agent_events_collection
+from services.agent_service import AgentService
+from services.leases import scheduler_leases
+
+# Max users with a pending check
+EVENT_CAPACITY = int(os.getenv("AGENT_EVENT_CAPACITY", "10000"))
+# Seconds events for the same user are merged before the check runs
+COALESCE_SECONDS = float(os.getenv("AGENT_EVENT_COALESCE_SECONDS", "2"))
+EVENT_WORKERS = int(os.getenv("AGENT_EVENT_WORKERS", "4"))
+DURABLE = os.getenv("AGENT_EVENTS_DURABLE", "false").lower() == "true"
+# Seconds a durable event stays claimed by its process without renewal
+EVENT_LEASE_SECONDS = float(os.getenv("AGENT_EVENT_LEASE_SECONDS", "60"))
+
+class AgentEventQueue:
+    def __init__(self):
+        # user_id -> monotonic time its check is due; (due, user_id) heap
+        self._pending = {}
+        self._queue = []
+        self._wakeup = Condition()
+        self._pool = None
+        self._thread = None
+        self._stopped = False
+
+    def publish(self, user_id: str) -> None:
+        """Schedule the agent checks for a user whose account changed"""
+        with self._wakeup:
+            if user_id in self._pending:
+                return  # Coalesced into the already pending check
+        if DURABLE and self._thread is not None:
+            # Stored before it is queued, so a crash in between cannot lose it
+            now = datetime.now(timezone.utc)
+            agent_events_collection.update_one(
+                {"_id": user_id},
+                {"$set": {
+                    "queued_at": now,
+                    "owner": scheduler_leases.owner_id,
+                    "expires_at": now + timedelta(seconds=EVENT_LEASE_SECONDS)
+                }},
+                upsert=True
+            )
+        self._enqueue(user_id)
+
+    def _enqueue(self, user_id: str) -> None:
+        """Queue a user's check, or run it inline when the queue cannot take it"""
+        with self._wakeup:
+            if user_id in self._pending:
+                return  # Coalesced into the already pending check
+            # Not running, or full: check inline
+            inline = self._thread is None or self._stopped or len(self._pending) >= EVENT_CAPACITY
+            if not inline:
+                due = time.monotonic() + COALESCE_SECONDS
+                self._pending[user_id] = due
+                heapq.heappush(self._queue, (due, user_id))
+                self._wakeup.notify()
+
+        if inline:
+            self._check(user_id)
+
+    def _check(self, user_id: str) -> None:
+        started = datetime.now(timezone.utc)
+        try:
+            AgentService.check_balance_risk(user_id)
+        except Exception as e:
+            print(f"Agent check failed for user {user_id}: {e}")
+        if DURABLE:
+            # Keep the event if the user changed again while we were checking
+            agent_events_collection.delete_one({"_id": user_id, "queued_at": {"$lte": started}})
+
+    def _dispatch(self) -> None:
+        """Hand each user's check to the pool once its window closes"""
+        while True:
+            with self._wakeup:
+                while not self._stopped and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._wakeup.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._stopped:
+                    return
+                _, user_id = heapq.heappop(self._queue)
+                # Events arriving from now on schedule a fresh check
+                del self._pending[user_id]
+            self._pool.submit(self._check, user_id)
+
+    def _claim_expired(self) -> int:
+        """Take over events whose owner stopped renewing them; returns how many"""
+        claimed = 0
+        while len(self._pending) < EVENT_CAPACITY:
+            now = datetime.now(timezone.utc)
+            event = agent_events_collection.find_one_and_update(
+                {"$or": [{"expires_at": {"$lt": now}}, {"expires_at": {"$exists": False}}]},
+                {"$set": {
+                    "owner": scheduler_leases.owner_id,
+                    "expires_at": now + timedelta(seconds=EVENT_LEASE_SECONDS)
+                }},
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if event is None:
+                break
+            self._enqueue(event["_id"])
+            claimed += 1
+        return claimed
+
+    def _maintain_leases(self) -> None:
+        """Renew this process's event leases and recover expired ones"""
+        while not self._stopped:
+            try:
+                agent_events_collection.update_many(
+                    {"owner": scheduler_leases.owner_id},
+                    {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=EVENT_LEASE_SECONDS)}}
+                )
+                recovered = self._claim_expired()
+                if recovered:
+                    print(f"Recovered {recovered} pending agent events")
+            except PyMongoError as e:
+                print(f"Agent event lease renewal failed: {e}")
+            time.sleep(EVENT_LEASE_SECONDS / 3)
+
+    def start(self) -> None:
+        """Start the dispatcher and, when durable, the event lease maintenance"""
+        if self._thread is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=EVENT_WORKERS, thread_name_prefix="agent-event")
+        self._thread = Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+        if DURABLE:
+            Thread(target=self._maintain_leases, daemon=True).start()
+
+    def stop(self) -> None:
+        """Run the checks still pending, then stop"""
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+        # The dispatcher may be handing a check to the pool; let it finish
+        # before the pool shuts down
+        if self._thread is not None:
+            self._thread.join()
+        with self._wakeup:
+            pending = list(self._pending)
+            self._pending.clear()
+            self._queue = []
+        if self._pool is not None:
+            for user_id in pending:
+                self._pool.submit(self._check, user_id)
+            self._pool.shutdown(wait=True)
+
+# Singleton instance
+agent_events = AgentEventQueue()
@@ -3,138 +3,174 @@ Agentic AI services for SafeBalance
 Handles buffer calculation, risk detection, and insight generation
 """
 from datetime import datetime, timedelta, timezone
+import numpy as np
 from typing import List, Dict
 from config import (
     virtual_accounts_collection, 
     scheduled_payments_collection,
-    insights_collection,
     users_collection
 )
-from models.schemas import InsightType, InsightPriority, Occurrence
+from models.schemas import InsightType, InsightPriority
 from bson import ObjectId
 from services.ml_service import ml_service
+from services.buffer_engine import weekly_buffers, payment_schedule
+from services.risk_engine import shortfall_probabilities, risk_level
+from services.insight_sink import InsightSink, sync_insights
+from services.payment_schedule import days_until_due, due_window
 
 class AgentService:
     
+    @staticmethod
+    def _day_bucket() -> str:
+        """Dedup bucket for insights sent at most once per UTC day"""
+        return datetime.now(timezone.utc).date().isoformat()
+    
+    @staticmethod
+    def _insert_insight(insight: Dict, subject: str, bucket: str, sink: InsightSink = None) -> None:
+        """
+        Insert an insight unless one with the same dedup key exists
+        The unique (user_id, type, dedup_subject, dedup_bucket) index makes
+        this one round trip and safe against concurrent checks.
+        Batch jobs pass a BufferedInsightSink to group the inserts.
+        """
+        insight["dedup_subject"] = subject
+        insight["dedup_bucket"] = bucket
+        (sink or sync_insights).write(insight)
+    
     @staticmethod
     def calculate_weekly_buffer(user_id: str) -> float:
         """
         Calculate the buffer needed for next 7 days based on scheduled payments
         """
-        scheduled_payments = list(scheduled_payments_collection.find({"user_id": user_id}))
-        
-        today = datetime.now(timezone.utc)
-        weekly_expenses = 0.0
-        
-        for payment in scheduled_payments:
-            first_date = datetime.fromisoformat(payment["firstdate"])
-            occurrence = payment["occurrence"]
-            amount = payment["amount"]
-            
-            # Check if payment falls in next 7 days
-            if occurrence == Occurrence.weekly.value:
-                # Weekly payments - definitely included
-                weekly_expenses += amount
-            elif occurrence == Occurrence.monthly.value:
-                # Check if payment day is in next 7 days
-                days_until_payment = (first_date.day - today.day) % 30
-                if 0 <= days_until_payment <= 7:
-                    weekly_expenses += amount
-            elif occurrence == Occurrence.annual.value:
-                # Check if annual payment is due in next 7 days
-                this_year_date = first_date.replace(year=today.year)
-                days_diff = (this_year_date - today).days
-                if 0 <= days_diff <= 7:
-                    weekly_expenses += amount
-        
-        return round(weekly_expenses, 2)
+        scheduled_payments = list(scheduled_payments_collection.find(
+            {"user_id": user_id},
+            {"user_id": 1, "amount": 1, "occurrence": 1, "firstdate": 1, "next_due": 1}
+        ))
+        return weekly_buffers(scheduled_payments, datetime.now(timezone.utc)).get(user_id, 0.0)
 
     @staticmethod
-    def predict_payment_risk(user_id: str) -> Dict:
+    def predict_payment_risk(user_id: str, sink: InsightSink = None) -> Dict:
         """
         AGENTIC AI: Predict risk of missing payments using ML model
-        
-        Logic:
-        1. Get current balance
-        2. Calculate next week's expenses (buffer)
-        3. Predict next week's income using Random Forest
-        4. Calculate probability of shortfall
-        5. Generate insight if risk is above threshold
+        See predict_payment_risk_batch
         """
-        # Get user's virtual account
-        account = virtual_accounts_collection.find_one({"user_id": user_id})
-        if not account:
-            return {"error": "Account not found"}
-        
-        current_balance = account["balance"]
-        weekly_expenses = AgentService.calculate_weekly_buffer(user_id)
-        
-        # Get ML prediction for next week's income
-        income_prediction = ml_service.predict_weekly_income(user_id)
+        return AgentService.predict_payment_risk_batch([user_id], sink)[user_id]
+    
+    @staticmethod
+    def predict_payment_risk_batch(user_ids: List[str], sink: InsightSink = None,
+                                   generate_insights: bool = True) -> Dict[str, Dict]:
+        """
+        AGENTIC AI: Predict risk of missing payments for many users at once
         
-        predicted_income_pessimistic = income_prediction['confidence_5th']
-        predicted_income_median = income_prediction['confidence_50th']
-        predicted_income_optimistic = income_prediction['confidence_95th']
+        Logic:
+        1. Get current balances (one query)
+        2. Lay out the next 8 days of scheduled payments per day (one query)
+        3. Predict next week's income distribution using Random Forest
+        4. Simulate the balance day by day to get the probability of shortfall
+        5. Generate insight if risk is above threshold (unless generate_insights is False)
         
-        # Calculate projected balance at end of week
-        projected_balance_pessimistic = current_balance + predicted_income_pessimistic - weekly_expenses
-        projected_balance_median = current_balance + predicted_income_median - weekly_expenses
-        projected_balance_optimistic = current_balance + predicted_income_optimistic - weekly_expenses
+        Errors are kept per user: if scoring the batch fails, each user is
+        scored on its own and a failing user gets {"error": ...}
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        accounts = {
+            account["user_id"]: account
+            for account in virtual_accounts_collection.find(
+                {"user_id": {"$in": user_ids}}, {"user_id": 1, "balance": 1}
+            )
+        }
+        results = {user_id: {"error": "Account not found"} for user_id in user_ids if user_id not in accounts}
+        user_ids = [user_id for user_id in user_ids if user_id in accounts]
+        if not user_ids:
+            return results
         
-        # Calculate risk probability based on scenarios
-        uncertainty = income_prediction['uncertainty']
+        try:
+            results.update(AgentService._score_payment_risk(user_ids, accounts, sink, generate_insights))
+        except Exception as e:
+            if len(user_ids) == 1:
+                print(f"Error predicting payment risk for user {user_ids[0]}: {e}")
+                results[user_ids[0]] = {"error": str(e)}
+                return results
+            # Find the failing users by scoring each on its own
+            print(f"Batch payment risk failed ({e}), scoring {len(user_ids)} users one by one")
+            for user_id in user_ids:
+                try:
+                    results.update(AgentService._score_payment_risk([user_id], accounts, sink, generate_insights))
+                except Exception as user_error:
+                    print(f"Error predicting payment risk for user {user_id}: {user_error}")
+                    results[user_id] = {"error": str(user_error)}
         
-        if projected_balance_pessimistic < 0:
-            # High risk - even pessimistic income won't cover expenses
-            risk_probability = 0.85 + (uncertainty * 0.15)  # 85-100% risk
-            risk_level = "critical"
-        elif projected_balance_median < 0:
-            # Medium-high risk - median scenario shows shortfall
-            risk_probability = 0.60 + (uncertainty * 0.25)  # 60-85% risk
-            risk_level = "high"
-        elif projected_balance_median < weekly_expenses * 0.5:
-            # Medium risk - balance will be low
-            risk_probability = 0.35 + (uncertainty * 0.25)  # 35-60% risk
-            risk_level = "medium"
-        elif projected_balance_optimistic < weekly_expenses:
-            # Low-medium risk
-            risk_probability = 0.15 + (uncertainty * 0.20)  # 15-35% risk
-            risk_level = "low"
-        else:
-            # Low risk - even optimistic scenario is safe
-            risk_probability = 0.05 + (uncertainty * 0.10)  # 5-15% risk
-            risk_level = "minimal"
-        
-        risk_probability = min(0.99, risk_probability)  # Cap at 99%
+        return results
+    
+    @staticmethod
+    def _score_payment_risk(user_ids: List[str], accounts: Dict[str, Dict], sink: InsightSink,
+                            generate_insights: bool) -> Dict[str, Dict]:
+        """Risk results for users that all have an account (see predict_payment_risk_batch)"""
+        results = {}
+        today = datetime.now(timezone.utc)
+        payments = list(scheduled_payments_collection.find(
+            {"user_id": {"$in": user_ids}},
+            {"user_id": 1, "amount": 1, "occurrence": 1, "firstdate": 1, "next_due": 1}
+        ))
+        buffers = weekly_buffers(payments, today)
+        schedules = payment_schedule(payments, user_ids, today)
         
-        result = {
-            "user_id": user_id,
-            "current_balance": current_balance,
-            "weekly_expenses": weekly_expenses,
-            "predicted_income_range": {
-                "pessimistic": predicted_income_pessimistic,
-                "median": predicted_income_median,
-                "optimistic": predicted_income_optimistic
-            },
-            "projected_balance_range": {
-                "pessimistic": round(projected_balance_pessimistic, 2),
-                "median": round(projected_balance_median, 2),
-                "optimistic": round(projected_balance_optimistic, 2)
-            },
-            "risk_probability": round(risk_probability, 2),
-            "risk_level": risk_level,
-            "model_uncertainty": uncertainty,
-            "model_available": income_prediction['model_available']
-        }
+        # Per-tree daily income predictions for next week
+        distributions = ml_service.predict_income_distribution_batch(user_ids)
+        balances = np.array([accounts[user_id]["balance"] for user_id in user_ids], dtype=np.float64)
+        probabilities = shortfall_probabilities(
+            balances,
+            [distributions[user_id][1] for user_id in user_ids],
+            schedules
+        )
         
-        # Generate insight if risk is above threshold (35%)
-        if risk_probability >= 0.35:
-            AgentService._generate_risk_insight(user_id, result)
+        for i, user_id in enumerate(user_ids):
+            income_prediction = distributions[user_id][0]
+            current_balance = accounts[user_id]["balance"]
+            weekly_expenses = buffers.get(user_id, 0.0)
+            
+            predicted_income_pessimistic = income_prediction['confidence_5th']
+            predicted_income_median = income_prediction['confidence_50th']
+            predicted_income_optimistic = income_prediction['confidence_95th']
+            
+            # Calculate projected balance at end of week
+            projected_balance_pessimistic = current_balance + predicted_income_pessimistic - weekly_expenses
+            projected_balance_median = current_balance + predicted_income_median - weekly_expenses
+            projected_balance_optimistic = current_balance + predicted_income_optimistic - weekly_expenses
+            
+            risk_probability = float(probabilities[i])
+            
+            result = {
+                "user_id": user_id,
+                "current_balance": current_balance,
+                "weekly_expenses": weekly_expenses,
+                "predicted_income_range": {
+                    "pessimistic": predicted_income_pessimistic,
+                    "median": predicted_income_median,
+                    "optimistic": predicted_income_optimistic
+                },
+                "projected_balance_range": {
+                    "pessimistic": round(projected_balance_pessimistic, 2),
+                    "median": round(projected_balance_median, 2),
+                    "optimistic": round(projected_balance_optimistic, 2)
+                },
+                "risk_probability": round(risk_probability, 2),
+                "risk_level": risk_level(risk_probability),
+                "model_uncertainty": income_prediction['uncertainty'],
+                "model_available": income_prediction['model_available'],
+                "model_version": income_prediction.get('model_version')
+            }
+            
+            # Generate insight if risk is above threshold (35%)
+            if generate_insights and risk_probability >= 0.35:
+                AgentService._generate_risk_insight(user_id, result, sink)
+            
+            results[user_id] = result
         
-        return result
+        return results
     
     @staticmethod
-    def _generate_risk_insight(user_id: str, risk_data: Dict):
+    def _generate_risk_insight(user_id: str, risk_data: Dict, sink: InsightSink = None):
         """Generate an insight based on risk prediction"""
         
         risk_prob = risk_data["risk_probability"]
@@ -143,17 +179,6 @@ class AgentService:
         weekly_expenses = risk_data["weekly_expenses"]
         shortage = weekly_expenses - current_balance - risk_data["predicted_income_range"]["pessimistic"]
         
-        # Check if similar insight exists in last 24 hours (avoid spam)
-        recent_cutoff = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
-        existing = insights_collection.find_one({
-            "user_id": user_id,
-            "type": InsightType.income_volatility_alert.value,
-            "created_at": {"$gte": recent_cutoff}
-        })
-        
-        if existing:
-            return  # Don't spam
-        
         # Determine priority and message based on risk level
         if risk_level == "critical":
             priority = InsightPriority.critical
@@ -198,7 +223,7 @@ class AgentService:
             "message": message,
             "action_suggestion": action,
             "read": False,
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "metadata": {
                 "risk_probability": risk_prob,
                 "risk_level": risk_level,
@@ -207,50 +232,23 @@ class AgentService:
             }
         }
         
-        insights_collection.insert_one(insight)
-        print(f"Generated ML-based risk insight for user {user_id} ({int(risk_prob*100)}% risk)")
+        # At most one risk insight per user per day (avoid spam)
+        AgentService._insert_insight(insight, "risk", AgentService._day_bucket(), sink)
 
     @staticmethod
-    def update_buffer_for_user(user_id: str) -> Dict:
-        """
-        Recalculate and update the buffer for a user's virtual account
-        """
-        new_buffer = AgentService.calculate_weekly_buffer(user_id)
-        
-        result = virtual_accounts_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"buffer": new_buffer}}
-        )
-        
-        return {
-            "user_id": user_id,
-            "new_buffer": new_buffer,
-            "updated": result.modified_count > 0
-        }
-    
-    @staticmethod
-    def check_balance_risk(user_id: str) -> None:
+    def check_balance_risk(user_id: str, account: Dict = None, sink: InsightSink = None) -> None:
         """
         Check if balance is below buffer and generate insights
+        account can be passed in when the caller already fetched it
         """
-        account = virtual_accounts_collection.find_one({"user_id": user_id})
+        if account is None:
+            account = virtual_accounts_collection.find_one({"user_id": user_id})
         if not account:
             return
         
         balance = account["balance"]
         buffer = account["buffer"]
         
-        # Check if already has recent similar insight (avoid spam)
-        recent_cutoff = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
-        existing_insight = insights_collection.find_one({
-            "user_id": user_id,
-            "type": InsightType.buffer_breach.value,
-            "created_at": {"$gte": recent_cutoff}
-        })
-        
-        if existing_insight:
-            return  # Don't spam user with same insight
-        
         # Risk levels
         if balance < buffer * 0.5:  # Balance less than 50% of buffer
             priority = InsightPriority.critical
@@ -282,50 +280,36 @@ class AgentService:
             "message": message,
             "action_suggestion": action,
             "read": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": datetime.now(timezone.utc)
         }
         
-        insights_collection.insert_one(insight)
-        print(f"Generated {priority.value} insight for user {user_id}")
+        # At most one balance insight per user per day (avoid spam)
+        AgentService._insert_insight(insight, "balance", AgentService._day_bucket(), sink)
     
     @staticmethod
-    def check_upcoming_payments(user_id: str) -> None:
+    def check_upcoming_payments(user_id: str, scheduled_payments: List[Dict] = None, sink: InsightSink = None) -> None:
         """
         Check for payments due in next 3 days and generate reminders
+        scheduled_payments can be passed in when the caller already fetched
+        the user's payments; only high importance ones are considered
         """
-        scheduled_payments = list(scheduled_payments_collection.find({
-            "user_id": user_id,
-            "importance": "high"
-        }))
-        
         today = datetime.now(timezone.utc)
         
+        if scheduled_payments is None:
+            # Only payments due in 1-3 days, straight from the next_due index
+            scheduled_payments = list(scheduled_payments_collection.find({
+                "user_id": user_id,
+                "importance": "high",
+                "next_due": due_window(today.date(), 1, 3)
+            }))
+        else:
+            scheduled_payments = [p for p in scheduled_payments if p["importance"] == "high"]
+        
         for payment in scheduled_payments:
-            first_date = datetime.fromisoformat(payment["firstdate"])
-            occurrence = payment["occurrence"]
-            
-            # Calculate days until payment
-            if occurrence == Occurrence.monthly.value:
-                days_until = (first_date.day - today.day) % 30
-            elif occurrence == Occurrence.weekly.value:
-                days_until = (first_date.weekday() - today.weekday()) % 7
-            else:
-                continue
+            days_until = days_until_due(payment, today.date())
             
             # Generate reminder if due in 1-3 days
             if 1 <= days_until <= 3:
-                # Check if already reminded
-                recent_cutoff = (datetime.now(timezone.utc) - timedelta(days=2)).isoformat()
-                existing = insights_collection.find_one({
-                    "user_id": user_id,
-                    "type": InsightType.payment_due_soon.value,
-                    "message": {"$regex": payment["particulars"]},
-                    "created_at": {"$gte": recent_cutoff}
-                })
-                
-                if existing:
-                    continue
-                
                 insight = {
                     "user_id": user_id,
                     "type": InsightType.payment_due_soon.value,
@@ -334,8 +318,9 @@ class AgentService:
                     "message": f"Your {payment['particulars']} payment of ₹{payment['amount']:.2f} is due in {days_until} day(s).",
                     "action_suggestion": f"Ensure ₹{payment['amount']:.2f} is available in your account.",
                     "read": False,
-                    "created_at": datetime.now(timezone.utc).isoformat()
+                    "created_at": datetime.now(timezone.utc)
                 }
                 
-                insights_collection.insert_one(insight)
-                print(f"Payment reminder created for {payment['particulars']}")
+                # One reminder per payment per due date
+                due = (today.date() + timedelta(days=days_until)).isoformat()
+                AgentService._insert_insight(insight, str(payment["_id"]), due, sink)
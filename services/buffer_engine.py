@@ -0,0 +1,123 @@
+"""
+Vectorized weekly buffer computation
+Loads scheduled payments into columnar numpy arrays and computes every
+user's next-7-days buffer with a handful of array operations, using each
+payment's materialized next_due date (see services/payment_schedule.py)
+"""
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from models.schemas import Occurrence
+
+# Days covered by payment schedules (today plus the next 7 days)
+SCHEDULE_DAYS = 8
+
+OCCURRENCE_CODES = {
+    Occurrence.weekly.value: 0,
+    Occurrence.monthly.value: 1,
+    Occurrence.annual.value: 2,
+}
+
+def as_days(values: List) -> np.ndarray:
+    """Stored date-only values (BSON dates, or pre-migration ISO strings) as datetime64[D]; None is NaT"""
+    return pd.to_datetime(values, utc=True, format="ISO8601").values.astype("datetime64[D]")
+
+def next_due_days(first: np.ndarray, occurrence: np.ndarray, today: np.datetime64) -> np.ndarray:
+    """
+    Vectorized services.payment_schedule.next_due_date: first occurrence on
+    or after today for each (firstdate, occurrence code)
+    """
+    elapsed = (today - first).astype(np.int64)
+    weekly = first + (-(-elapsed // 7) * 7).astype("timedelta64[D]")
+
+    def add_months(months):
+        # first shifted by whole months, clamped to the end of shorter months
+        month = first.astype("datetime64[M]") + months.astype("timedelta64[M]")
+        month_days = ((month + 1).astype("datetime64[D]") - month.astype("datetime64[D]")).astype(np.int64)
+        first_day = (first - first.astype("datetime64[M]").astype("datetime64[D]")).astype(np.int64)
+        return month.astype("datetime64[D]") + np.minimum(first_day, month_days - 1).astype("timedelta64[D]")
+
+    first_year = first.astype("datetime64[Y]").astype(np.int64)
+    today_year = today.astype("datetime64[Y]").astype(np.int64)
+    annual = occurrence == OCCURRENCE_CODES[Occurrence.annual.value]
+    # This month's (or this year's) occurrence, else the following one
+    months = np.where(
+        annual,
+        (today_year - first_year) * 12,
+        (today.astype("datetime64[M]") - first.astype("datetime64[M]")).astype(np.int64)
+    )
+    due = add_months(months)
+    due = np.where(due < today, add_months(months + np.where(annual, 12, 1)), due)
+
+    due = np.where(occurrence == OCCURRENCE_CODES[Occurrence.weekly.value], weekly, due)
+    return np.where(first >= today, first, due)
+
+class PaymentColumns:
+    """Scheduled payments as parallel arrays, one entry per payment"""
+    def __init__(self, payments: List[Dict], today: datetime):
+        n = len(payments)
+        today_d = today.date()
+        self.user_ids, self.user_codes = np.unique(
+            np.array([p["user_id"] for p in payments]), return_inverse=True
+        )
+        self.amount = np.fromiter((p["amount"] for p in payments), dtype=np.float64, count=n)
+        self.occurrence = np.fromiter(
+            (OCCURRENCE_CODES.get(p["occurrence"], -1) for p in payments), dtype=np.int8, count=n
+        )
+        today_day = np.datetime64(today_d, "D")
+        # Materialized next_due dates in one conversion; only missing or
+        # passed ones (advance_due_dates not run yet) are recomputed
+        next_due = as_days([p.get("next_due") for p in payments])
+        stale = np.isnat(next_due) | (next_due < today_day)
+        if stale.any():
+            indexes = np.flatnonzero(stale)
+            next_due[indexes] = next_due_days(
+                as_days([payments[i]["firstdate"] for i in indexes]), self.occurrence[indexes], today_day
+            )
+        self.days_until = (next_due - today_day).astype(np.int64)
+
+def weekly_buffers(payments: List[Dict], today: datetime) -> Dict[str, float]:
+    """
+    Buffer needed for the next 7 days for every user with payments:
+    the sum of payments whose next due date is 0-7 days away
+    (weekly payments always are)
+    """
+    if not payments:
+        return {}
+
+    columns = PaymentColumns(payments, today)
+    due = (columns.occurrence >= 0) & (columns.days_until <= 7)
+    totals = np.bincount(
+        columns.user_codes,
+        weights=np.where(due, columns.amount, 0.0),
+        minlength=len(columns.user_ids)
+    )
+    return {
+        user_id: round(float(total), 2)
+        for user_id, total in zip(columns.user_ids.tolist(), totals)
+    }
+
+def payment_schedule(payments: List[Dict], user_ids: List[str], today: datetime,
+                     days: int = SCHEDULE_DAYS) -> np.ndarray:
+    """
+    Amount due per user per day: row i is user_ids[i], column d is d days
+    from today. Weekly payments repeat within the window.
+    """
+    schedule = np.zeros((len(user_ids), days))
+    if not payments:
+        return schedule
+
+    columns = PaymentColumns(payments, today)
+    # Map the payments' user codes onto the requested row order
+    row_of = {user_id: row for row, user_id in enumerate(user_ids)}
+    rows = np.array([row_of.get(user_id, -1) for user_id in columns.user_ids.tolist()])[columns.user_codes]
+
+    weekly = columns.occurrence == OCCURRENCE_CODES[Occurrence.weekly.value]
+    for offset in range(0, days, 7):
+        # First occurrence for every payment, later weeks for weekly ones
+        day = columns.days_until + offset
+        hit = (rows >= 0) & (columns.occurrence >= 0) & (day < days) & (weekly | (offset == 0))
+        np.add.at(schedule, (rows[hit], day[hit]), columns.amount[hit])
+    return schedule
+
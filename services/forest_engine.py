@@ -0,0 +1,178 @@
+"""
+Vectorized inference engine for the income Random Forest
+Evaluates every tree of the forest in one numpy pass instead of
+calling sklearn's predict once per estimator
+
+The flattened arrays can be exported once from the pickled sklearn model:
+    python -m services.forest_engine export ./model/income_volatility_7day_model.pkl ./model/model_config_7day.json
+which writes one .npy file per array next to the config and records their
+layout under "array_layout" in the config. The service then memory-maps
+them (no sklearn import), so every worker process shares the same
+page-cache-backed arrays instead of holding its own copy
+"""
+import json
+import os
+import sys
+from typing import Dict
+import numpy as np
+
+ARRAY_FIELDS = ("roots", "children_left", "children_right", "feature", "threshold", "value")
+
+def _round_down_float32(values: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 <= each float64 value
+    For float32 inputs x, `x <= result` is then exactly `x <= value`
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+class ForestEngine:
+    def __init__(self, roots, children_left, children_right, feature, threshold, value, max_depth):
+        self.roots = roots
+        self.children_left = children_left
+        self.children_right = children_right
+        self.feature = feature
+        self.threshold = threshold
+        self.value = value
+        self.max_depth = int(max_depth)
+        self.n_trees = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, forest) -> "ForestEngine":
+        """Flatten the node arrays of a fitted sklearn forest into one set of arrays"""
+        roots, lefts, rights, features, thresholds, values = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes)
+            is_leaf = tree.children_left == -1
+
+            # Leaves point back at themselves so traversal can run a fixed number of steps
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            roots.append(offset)
+            lefts.append(left)
+            rights.append(right)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            values.append(tree.value[:, 0, 0])
+
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        # Compact dtypes: node ids fit in int32, feature ids in int16 and
+        # thresholds in float32 (rounded down so splits stay exact).
+        # Leaf values stay float64 to reproduce sklearn's outputs exactly.
+        return cls(
+            roots=np.array(roots, dtype=np.int32),
+            children_left=np.concatenate(lefts).astype(np.int32),
+            children_right=np.concatenate(rights).astype(np.int32),
+            feature=np.concatenate(features).astype(np.int16),
+            threshold=_round_down_float32(np.concatenate(thresholds)),
+            value=np.concatenate(values).astype(np.float64),
+            max_depth=max_depth
+        )
+
+    def save(self, directory: str) -> Dict:
+        """
+        Write each array to its own .npy file in directory
+        Returns the layout description stored in the model config
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        for name in ARRAY_FIELDS:
+            array = np.ascontiguousarray(getattr(self, name))
+            filename = f"{name}.npy"
+            np.save(os.path.join(directory, filename), array)
+            arrays[name] = {
+                "file": filename,
+                "dtype": array.dtype.name,
+                "shape": list(array.shape)
+            }
+
+        return {
+            "directory": os.path.basename(os.path.normpath(directory)),
+            "n_trees": self.n_trees,
+            "max_depth": self.max_depth,
+            "arrays": arrays
+        }
+
+    @classmethod
+    def load(cls, directory: str, layout: Dict, mmap_mode: str = 'r') -> "ForestEngine":
+        """Load (memory-map by default) the arrays described by layout"""
+        arrays = {}
+        for name in ARRAY_FIELDS:
+            spec = layout["arrays"][name]
+            array = np.load(os.path.join(directory, spec["file"]), mmap_mode=mmap_mode)
+            if array.dtype.name != spec["dtype"] or list(array.shape) != spec["shape"]:
+                raise ValueError(f"Model array '{name}' does not match the configured layout")
+            arrays[name] = array.view(np.ndarray)
+
+        return cls(max_depth=layout["max_depth"], **arrays)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAY_FIELDS)
+
+    def predict_trees(self, X) -> np.ndarray:
+        """
+        Predict with every tree at once
+        Returns an array of shape (n_samples, n_trees)
+        """
+        # sklearn evaluates splits on float32 inputs
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+
+        return self.value[nodes]
+
+    def predict(self, X) -> np.ndarray:
+        """Forest prediction (mean over trees) for each sample"""
+        return self.predict_trees(X).mean(axis=1)
+
+def export(model_path: str, config_path: str) -> None:
+    """
+    Compile a pickled sklearn forest into the flat array format
+    Arrays go in a directory named after the model file, next to the config
+    """
+    import pickle
+
+    with open(model_path, 'rb') as f:
+        forest = pickle.load(f)
+
+    engine = ForestEngine.from_sklearn(forest)
+
+    # Check the compiled forest against sklearn on inputs that hit every split
+    rng = np.random.default_rng(0)
+    split_values = engine.threshold[engine.children_left != np.arange(len(engine.children_left))]
+    X = rng.choice(split_values, size=(1000, forest.n_features_in_)).astype(np.float32)
+    if not np.allclose(engine.predict(X), forest.predict(X), rtol=1e-9, atol=1e-9):
+        raise ValueError("Compiled forest does not reproduce sklearn predictions")
+
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    directory = os.path.join(os.path.dirname(config_path), model_name)
+    layout = engine.save(directory)
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    config["array_layout"] = layout
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+    print(f"Exported {engine.n_trees} trees ({engine.nbytes / 1e6:.1f} MB) to {directory}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "export":
+        print("Usage: python -m services.forest_engine export <model.pkl> <model_config.json>")
+        sys.exit(1)
+    export(sys.argv[2], sys.argv[3])
@@ -0,0 +1,283 @@
+"""
+Per-account recent deposits maintained on write
+Each account keeps its deposits of the last WINDOW_DAYS days in one
+document, so preparing prediction features is a single indexed read
+instead of a 30-day transaction scan. Features are still computed from
+the individual deposits (see MLPredictionService._build_features).
+"""
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from config import (
+    income_features_collection,
+    transactions_collection,
+    virtual_accounts_collection
+)
+
+# Days of deposits kept per account
+WINDOW_DAYS = 30
+# Deposits stored per account; accounts with more inside the window are
+# read from transactions instead
+MAX_STORED_DEPOSITS = int(os.getenv("INCOME_MAX_STORED_DEPOSITS", "1000"))
+
+def deposit_entry(tx_id: str, tx_datetime, amount: float) -> Dict:
+    """Stored form of a deposit, identical to what deposits_pipeline builds"""
+    if isinstance(tx_datetime, str):
+        tx_datetime = datetime.fromisoformat(tx_datetime)
+    if tx_datetime.tzinfo is None:
+        tx_datetime = tx_datetime.replace(tzinfo=timezone.utc)
+    # BSON dates hold milliseconds
+    at = tx_datetime.astimezone(timezone.utc)
+    at = at.replace(microsecond=at.microsecond // 1000 * 1000)
+    return {"tx_id": str(tx_id), "at": at, "amount": float(amount)}
+
+def recent_amounts(entries: List[Dict], since: datetime) -> List[float]:
+    """Amounts of the deposits made since a cutoff, newest first"""
+    by_tx = {entry["tx_id"]: entry for entry in entries}
+    recent = [entry for entry in by_tx.values() if entry["at"] >= since]
+    recent.sort(key=lambda entry: entry["at"], reverse=True)
+    return [entry["amount"] for entry in recent]
+
+def _deposits_match(acct_ids: List[str], since: datetime) -> Dict:
+    # Served by the acct_id/type/datetime index
+    return {"$match": {
+        "acct_id": {"$in": acct_ids},
+        "type": "deposit",
+        "datetime": {"$gte": since}
+    }}
+
+def deposits_pipeline(acct_ids: List[str], since: datetime) -> List[Dict]:
+    """Aggregation behind aggregate_deposits"""
+    return [
+        _deposits_match(acct_ids, since),
+        # One document per account, deposits unordered (callers sort them)
+        {"$group": {
+            "_id": "$acct_id",
+            "deposits": {"$push": {"tx_id": {"$toString": "$_id"}, "at": "$datetime", "amount": "$amount"}},
+            "last_tx_id": {"$max": "$_id"}
+        }}
+    ]
+
+def deposit_totals_pipeline(acct_ids: List[str], since: datetime) -> List[Dict]:
+    """Aggregation behind aggregate_deposit_totals"""
+    return [
+        _deposits_match(acct_ids, since),
+        {"$group": {
+            "_id": "$acct_id",
+            "deposit_total": {"$sum": "$amount"},
+            "deposit_count": {"$sum": 1},
+            "last_tx_id": {"$max": "$_id"}
+        }}
+    ]
+
+def aggregate_deposits(acct_ids: List[str], since: datetime) -> Dict[str, Dict]:
+    """
+    Each account's deposits since a cutoff, for backfilling the store
+    Returns one document per account: {"deposits": [{tx_id, at, amount}]
+    newest first, "last_tx_id"}
+    """
+    summaries = {}
+    for doc in transactions_collection.aggregate(deposits_pipeline(acct_ids, since)):
+        doc["last_tx_id"] = str(doc["last_tx_id"])
+        # Sorted here rather than with a $sort stage, which could sort in memory
+        doc["deposits"].sort(key=lambda entry: entry["at"], reverse=True)
+        summaries[doc.pop("_id")] = doc
+    return summaries
+
+def aggregate_deposit_totals(acct_ids: List[str], since: datetime) -> Dict[str, Dict]:
+    """
+    Summarize each account's deposits since a cutoff inside MongoDB
+    Returns only the numbers per account: {"deposit_total", "deposit_count",
+    "last_tx_id"}
+    """
+    summaries = {}
+    for doc in transactions_collection.aggregate(deposit_totals_pipeline(acct_ids, since)):
+        doc["last_tx_id"] = str(doc["last_tx_id"])
+        summaries[doc.pop("_id")] = doc
+    return summaries
+
+def _prune(acct_id: str, since: datetime) -> UpdateOne:
+    """Drop an account's stored deposits older than the window"""
+    return UpdateOne({"_id": acct_id}, {"$pull": {"deposits": {"at": {"$lt": since}}}})
+
+class IncomeFeatureStore:
+
+    @staticmethod
+    def seed_account(acct_id: str, user_id: str) -> None:
+        """Start an empty income history for a newly created account"""
+        income_features_collection.update_one(
+            {"_id": acct_id},
+            {"$setOnInsert": {"user_id": user_id, "deposits": [], "deposits_complete": True}},
+            upsert=True
+        )
+
+    @staticmethod
+    def record_deposit(acct_id: str, user_id: str, tx_datetime, amount: float, tx_id: str) -> None:
+        """
+        Add a deposit to the account's recent deposits
+        One atomic $push keeping the array sorted and bounded, so concurrent
+        deposits never lose updates, then a $pull of deposits that left the
+        window (one round trip). last_tx_id is the watermark that keys
+        cached predictions.
+        """
+        since = datetime.now(timezone.utc) - timedelta(days=WINDOW_DAYS)
+        income_features_collection.bulk_write([
+            UpdateOne(
+                {"_id": acct_id},
+                {
+                    "$push": {"deposits": {
+                        "$each": [deposit_entry(tx_id, tx_datetime, amount)],
+                        "$sort": {"at": -1},
+                        "$slice": MAX_STORED_DEPOSITS
+                    }},
+                    "$set": {"last_tx_id": tx_id},
+                    "$setOnInsert": {"user_id": user_id}
+                },
+                upsert=True
+            ),
+            _prune(acct_id, since)
+        ])
+
+    @staticmethod
+    def get_income_state(user_ids: List[str], now: datetime = None) -> Dict[str, Dict]:
+        """
+        Income state for each user: {"deposits": amounts of the deposits of
+        the last WINDOW_DAYS days, newest first, "last_tx_id": id of the
+        latest recorded deposit or None}
+        Accounts created before this store existed are backfilled from
+        their transactions on first read
+        """
+        now = now or datetime.now(timezone.utc)
+        since = now - timedelta(days=WINDOW_DAYS)
+
+        docs_by_user = {
+            doc["user_id"]: doc
+            for doc in income_features_collection.find(
+                {"user_id": {"$in": user_ids}, "deposits_complete": True},
+                {"user_id": 1, "deposits": 1, "last_tx_id": 1}
+            )
+        }
+
+        missing = [user_id for user_id in user_ids if user_id not in docs_by_user]
+        if missing:
+            docs_by_user.update(IncomeFeatureStore._backfill(missing, now))
+
+        # Accounts without recent deposits are pruned here instead of on write
+        stale = [
+            _prune(doc["_id"], since)
+            for doc in docs_by_user.values()
+            if any(entry["at"] < since for entry in doc["deposits"])
+        ]
+        if stale:
+            income_features_collection.bulk_write(stale, ordered=False)
+
+        # A full document may have dropped deposits that are still in the window
+        overflow = {
+            doc["_id"]: user_id
+            for user_id, doc in docs_by_user.items()
+            if len(doc["deposits"]) >= MAX_STORED_DEPOSITS
+            and min(entry["at"] for entry in doc["deposits"]) >= since
+        }
+        if overflow:
+            summaries = aggregate_deposits(list(overflow), since)
+            for acct_id, user_id in overflow.items():
+                docs_by_user[user_id]["deposits"] = summaries.get(acct_id, {}).get("deposits", [])
+
+        return {
+            user_id: {
+                "deposits": recent_amounts(docs_by_user.get(user_id, {}).get("deposits", []), since),
+                "last_tx_id": docs_by_user.get(user_id, {}).get("last_tx_id")
+            }
+            for user_id in user_ids
+        }
+
+    @staticmethod
+    def rebuild(acct_to_user: Dict[str, str], now: datetime = None) -> None:
+        """
+        Recompute accounts' income state from their transactions
+        Used after bulk imports instead of one record_deposit per row
+        """
+        now = now or datetime.now(timezone.utc)
+        IncomeFeatureStore._merge(acct_to_user, now)
+
+    @staticmethod
+    def _backfill(user_ids: List[str], now: datetime) -> Dict[str, Dict]:
+        """Build and store income state from the last WINDOW_DAYS of deposits"""
+        acct_to_user = {
+            str(account["_id"]): account["user_id"]
+            for account in virtual_accounts_collection.find(
+                {"user_id": {"$in": user_ids}}, {"user_id": 1}
+            )
+        }
+        if not acct_to_user:
+            return {}
+
+        summaries = IncomeFeatureStore._merge(acct_to_user, now, {"deposits_complete": {"$ne": True}})
+        return {
+            user_id: {
+                "_id": acct_id,
+                "deposits": summaries.get(acct_id, {}).get("deposits", []),
+                "last_tx_id": summaries.get(acct_id, {}).get("last_tx_id")
+            }
+            for acct_id, user_id in acct_to_user.items()
+        }
+
+    @staticmethod
+    def _merge(acct_to_user: Dict[str, str], now: datetime, only: Dict = None) -> Dict[str, Dict]:
+        """
+        Add accounts' deposits of the last WINDOW_DAYS days from transactions
+        to their stored state and mark it complete
+        Documents are created empty first and deposits not stored yet are
+        $pushed with the same $sort/$slice as record_deposit, so a deposit
+        recorded between the aggregation and the write is kept. Returns the
+        aggregated summaries.
+        """
+        since = now - timedelta(days=WINDOW_DAYS)
+        try:
+            income_features_collection.bulk_write([
+                UpdateOne(
+                    {"_id": acct_id},
+                    {"$setOnInsert": {"user_id": user_id, "deposits": []}},
+                    upsert=True
+                )
+                for acct_id, user_id in acct_to_user.items()
+            ], ordered=False)
+        except BulkWriteError as e:
+            # Duplicate keys only mean a concurrent writer created the document first
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+        summaries = aggregate_deposits(list(acct_to_user), since)
+        stored = {
+            doc["_id"]: {entry["tx_id"] for entry in doc.get("deposits", [])}
+            for doc in income_features_collection.find(
+                {"_id": {"$in": list(acct_to_user)}}, {"deposits.tx_id": 1}
+            )
+        }
+
+        operations = []
+        for acct_id, user_id in acct_to_user.items():
+            summary = summaries.get(acct_id, {})
+            new_deposits = [
+                entry for entry in summary.get("deposits", [])
+                if entry["tx_id"] not in stored.get(acct_id, set())
+            ]
+            update = {
+                "$push": {"deposits": {
+                    "$each": new_deposits[:MAX_STORED_DEPOSITS],
+                    "$sort": {"at": -1},
+                    "$slice": MAX_STORED_DEPOSITS
+                }},
+                "$set": {"user_id": user_id, "deposits_complete": True}
+            }
+            if summary.get("last_tx_id"):
+                update["$max"] = {"last_tx_id": summary["last_tx_id"]}
+            operations.append(UpdateOne({"_id": acct_id, **(only or {})}, update))
+            operations.append(_prune(acct_id, since))
+        income_features_collection.bulk_write(operations)
+        return summaries
+
+# Singleton instance
+income_features = IncomeFeatureStore()
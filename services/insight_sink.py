@@ -0,0 +1,105 @@
+"""
+Insight writers used by AgentService
+InsightSink writes each insight as it is generated (request path).
+BufferedInsightSink collects insights from a batch job and writes them
+with insert_many(ordered=False) by size or age (a timer armed by the first
+buffered insight flushes even when no further writes come), logging one
+summary line per flush instead of one line per insight. Jobs flush it at
+the end.
+
+Duplicates are rejected by the unique dedup index on insights (see
+AgentService._insert_insight) and counted, not raised.
+"""
+import os
+import time
+from threading import Lock, Timer
+from typing import Dict
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from config import insights_collection
+
+# Insights buffered before a flush
+INSIGHT_BATCH_SIZE = int(os.getenv("INSIGHT_BATCH_SIZE", "500"))
+# Seconds an insight may wait in the buffer
+INSIGHT_FLUSH_SECONDS = float(os.getenv("INSIGHT_FLUSH_SECONDS", "5"))
+
+class InsightSink:
+    def write(self, insight: Dict) -> None:
+        """Insert one insight now"""
+        try:
+            insights_collection.insert_one(insight)
+        except DuplicateKeyError:
+            return
+        print(f"Generated {insight['priority']} {insight['type']} insight for user {insight['user_id']}")
+
+    def flush(self) -> None:
+        pass
+
+class BufferedInsightSink(InsightSink):
+    def __init__(self, name: str, batch_size: int = INSIGHT_BATCH_SIZE,
+                 flush_seconds: float = INSIGHT_FLUSH_SECONDS):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.inserted = 0
+        self.duplicates = 0
+        self._buffer = []
+        self._oldest = None
+        self._timer = None
+        self._lock = Lock()
+
+    def write(self, insight: Dict) -> None:
+        """Buffer an insight, flushing when the buffer is full or old enough"""
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+                self._arm_timer()
+            self._buffer.append(insight)
+            if (len(self._buffer) < self.batch_size
+                    and time.monotonic() - self._oldest < self.flush_seconds):
+                return
+            batch = self._take()
+        self._insert(batch)
+
+    def flush(self) -> None:
+        """Write everything buffered so far"""
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._insert(batch)
+
+    def _arm_timer(self) -> None:
+        # Flushes the buffer once its oldest insight is flush_seconds old
+        self._timer = Timer(self.flush_seconds, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"[{self.name}] timed insight flush failed: {e}")
+
+    def _take(self):
+        """Empty the buffer and disarm its timer (caller holds the lock)"""
+        batch, self._buffer = self._buffer, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _insert(self, batch) -> None:
+        duplicates = 0
+        try:
+            insights_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details["writeErrors"]
+            if any(error["code"] != 11000 for error in errors):
+                raise
+            duplicates = len(errors)
+        with self._lock:
+            self.inserted += len(batch) - duplicates
+            self.duplicates += duplicates
+        print(f"[{self.name}] wrote {len(batch) - duplicates} insights ({duplicates} duplicates skipped)")
+
+# Shared synchronous sink for request-path callers
+sync_insights = InsightSink()
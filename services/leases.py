@@ -0,0 +1,104 @@
+"""
+Leader election for scheduled jobs via leases stored in MongoDB
+Every API process runs the scheduler, but a job only executes in the
+process currently holding that job's lease. Holders renew their leases
+with a heartbeat; when a holder dies its lease expires and another
+process takes it over on its next heartbeat.
+"""
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from threading import Lock, Thread
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from config import leases_collection
+
+# Seconds a lease stays valid without renewal
+LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", "30"))
+
+class LeaseManager:
+    def __init__(self, ttl_seconds: float = LEASE_TTL):
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl_seconds = ttl_seconds
+        self._names = set()
+        # Lease name -> monotonic time until which we know we hold it
+        self._held_until = {}
+        self._lock = Lock()
+        self._heartbeat_started = False
+
+    def register(self, name: str) -> None:
+        """Compete for a lease from now on"""
+        with self._lock:
+            self._names.add(name)
+
+    def try_acquire(self, name: str) -> bool:
+        """
+        Take the lease if it is free or expired, or renew it if we hold it
+        One round trip: the conditional upsert fails with a duplicate key
+        when another live owner holds the lease
+        """
+        started = time.monotonic()
+        now = datetime.now(timezone.utc)
+        try:
+            lease = leases_collection.find_one_and_update(
+                {"_id": name, "$or": [{"owner": self.owner_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {
+                    "owner": self.owner_id,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds),
+                    "renewed_at": now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            held = lease["owner"] == self.owner_id
+        except DuplicateKeyError:
+            held = False
+        except PyMongoError as e:
+            print(f"Lease {name} renewal failed: {e}")
+            held = False
+
+        with self._lock:
+            was_held = name in self._held_until
+            if held:
+                self._held_until[name] = started + self.ttl_seconds
+            else:
+                self._held_until.pop(name, None)
+        if held and not was_held:
+            print(f"Acquired lease {name} as {self.owner_id}")
+        elif was_held and not held:
+            print(f"Lost lease {name}")
+        return held
+
+    def holds(self, name: str) -> bool:
+        """Whether this process currently holds a valid lease"""
+        with self._lock:
+            return self._held_until.get(name, 0) > time.monotonic()
+
+    def release_all(self) -> None:
+        """Give up all leases so another process can take over immediately"""
+        with self._lock:
+            names = list(self._held_until)
+            self._held_until.clear()
+        if names:
+            leases_collection.delete_many({"_id": {"$in": names}, "owner": self.owner_id})
+
+    def start_heartbeat(self) -> None:
+        """Renew held leases and try to acquire free ones in a background thread"""
+        if self._heartbeat_started:
+            return
+        self._heartbeat_started = True
+
+        def heartbeat():
+            while True:
+                with self._lock:
+                    names = list(self._names)
+                for name in names:
+                    self.try_acquire(name)
+                time.sleep(self.ttl_seconds / 3)
+
+        Thread(target=heartbeat, daemon=True).start()
+
+# Singleton instance
+scheduler_leases = LeaseManager()
@@ -0,0 +1,90 @@
+"""
+Ledger write path for transactions
+Posting a transaction is one conditional find_one_and_update on the
+account ($inc guarded by balance >= amount for withdrawals) plus one
+insert of the transaction document. Concurrent withdrawals can never
+overdraw: only one of them matches the guarded filter.
+
+With LEDGER_USE_TRANSACTIONS=true (requires a replica set) both writes
+run in one multi-document transaction. Otherwise a failed insert reverts
+the balance change.
+"""
+import os
+from typing import Dict, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument
+from config import client, transactions_collection, virtual_accounts_collection
+from models.schemas import TransactionType
+from services.agent_events import agent_events
+from services.income_features import income_features
+
+USE_TRANSACTIONS = os.getenv("LEDGER_USE_TRANSACTIONS", "false").lower() == "true"
+
+class AccountNotFoundError(Exception):
+    pass
+
+class InsufficientBalanceError(Exception):
+    def __init__(self, balance: float, amount: float):
+        super().__init__(f"Insufficient balance: {balance} < {amount}")
+        self.balance = balance
+        self.amount = amount
+
+class Ledger:
+
+    @staticmethod
+    def post(account_filter: Dict, tx: Dict) -> Tuple[Dict, Dict]:
+        """
+        Apply a transaction to the account matching account_filter and
+        record it. Fills in tx's _id (as a string) and acct_id.
+        Returns (tx, account after the update)
+        Raises AccountNotFoundError / InsufficientBalanceError
+        """
+        amount = tx["amount"]
+        guarded_filter = dict(account_filter)
+        if tx["type"] == TransactionType.deposit.value:
+            delta = amount
+        else:
+            delta = -amount
+            guarded_filter["balance"] = {"$gte": amount}
+        tx_id = ObjectId()
+
+        def write(session=None) -> Dict:
+            account = virtual_accounts_collection.find_one_and_update(
+                guarded_filter,
+                {"$inc": {"balance": delta}},
+                projection={"user_id": 1, "balance": 1},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if account is None:
+                # Failure path only: tell a missing account from a low balance
+                existing = virtual_accounts_collection.find_one(account_filter, {"balance": 1}, session=session)
+                if existing is None:
+                    raise AccountNotFoundError()
+                raise InsufficientBalanceError(existing["balance"], amount)
+
+            tx["_id"] = tx_id
+            tx["acct_id"] = str(account["_id"])
+            try:
+                transactions_collection.insert_one(tx, session=session)
+            except Exception:
+                if session is None:
+                    # Undo the balance change so the ledger stays consistent
+                    virtual_accounts_collection.update_one({"_id": account["_id"]}, {"$inc": {"balance": -delta}})
+                raise
+            return account
+
+        if USE_TRANSACTIONS:
+            with client.start_session() as session:
+                account = session.with_transaction(write)
+        else:
+            account = write()
+
+        tx["_id"] = str(tx_id)
+        if tx["type"] == TransactionType.deposit.value:
+            income_features.record_deposit(tx["acct_id"], account["user_id"], tx["datetime"], amount, tx["_id"])
+        agent_events.publish(account["user_id"])
+        return tx, account
+
+# Singleton instance
+ledger = Ledger()
@@ -0,0 +1,107 @@
+"""
+Materialized due dates for scheduled payments
+Every payment stores next_due: its first occurrence on or after today.
+"Payments due in the next N days" is then one indexed range query on
+next_due across all users instead of recomputing each payment's schedule
+from firstdate. advance_due_dates moves passed dates forward and
+backfills payments created before the field existed.
+
+Date-only fields (firstdate, next_due) are stored as BSON dates at UTC
+midnight.
+"""
+import calendar
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict
+from pymongo import UpdateOne
+from config import scheduled_payments_collection
+from models.schemas import Occurrence
+
+# Payments updated per bulk_write when advancing due dates
+ADVANCE_BATCH_SIZE = 1000
+
+def _add_months(first: date, months: int) -> date:
+    """first shifted by whole months, clamped to the end of shorter months"""
+    month_index = first.month - 1 + months
+    year, month = first.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(first.day, calendar.monthrange(year, month)[1]))
+
+def as_day(value) -> date:
+    """Calendar day of a stored date-only field"""
+    if isinstance(value, str):
+        # Written before the BSON date migration
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.date()
+    return value
+
+def day_start(day: date) -> datetime:
+    """UTC midnight of a day, the stored form of date-only fields"""
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def next_due_date(firstdate, occurrence: str, today: date) -> date:
+    """First occurrence of a payment on or after today"""
+    first = as_day(firstdate)
+    if first >= today:
+        return first
+
+    if occurrence == Occurrence.weekly.value:
+        weeks = -(-(today - first).days // 7)
+        return first + timedelta(weeks=weeks)
+
+    # This month's (or this year's) occurrence, else the following one
+    if occurrence == Occurrence.annual.value:
+        step, months = 12, (today.year - first.year) * 12
+    else:
+        step, months = 1, (today.year - first.year) * 12 + today.month - first.month
+    due = _add_months(first, months)
+    if due < today:
+        due = _add_months(first, months + step)
+    return due
+
+def current_due(payment: Dict, today: date) -> date:
+    """Stored next_due, recomputed when missing or already passed"""
+    next_due = payment.get("next_due")
+    if next_due is not None and as_day(next_due) >= today:
+        return as_day(next_due)
+    return next_due_date(payment["firstdate"], payment["occurrence"], today)
+
+def days_until_due(payment: Dict, today: date) -> int:
+    return (current_due(payment, today) - today).days
+
+def due_window(today: date, first_day: int, last_day: int) -> Dict:
+    """next_due range for payments due first_day..last_day days from today"""
+    return {
+        "$gte": day_start(today + timedelta(days=first_day)),
+        "$lte": day_start(today + timedelta(days=last_day))
+    }
+
+def advance_due_dates(today: date = None) -> int:
+    """
+    Move every passed (or missing) next_due to the payment's next occurrence
+    Returns the number of payments updated
+    """
+    today = today or datetime.now(timezone.utc).date()
+    # {"next_due": None} also matches payments without the field, via the index
+    stale = scheduled_payments_collection.find(
+        {"$or": [{"next_due": {"$lt": day_start(today)}}, {"next_due": None}]},
+        {"firstdate": 1, "occurrence": 1}
+    )
+
+    updated = 0
+    operations = []
+    for payment in stale:
+        operations.append(UpdateOne(
+            {"_id": payment["_id"]},
+            {"$set": {"next_due": day_start(next_due_date(payment["firstdate"], payment["occurrence"], today))}}
+        ))
+        if len(operations) >= ADVANCE_BATCH_SIZE:
+            updated += scheduled_payments_collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += scheduled_payments_collection.bulk_write(operations, ordered=False).modified_count
+
+    if updated:
+        print(f"Advanced next due date of {updated} scheduled payments")
+    return updated
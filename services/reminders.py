@@ -0,0 +1,235 @@
+"""
+Event-driven payment reminders
+Instead of polling every user, a priority queue holds the moment each
+upcoming high importance payment enters its reminder window (00:00 UTC,
+REMINDER_DAYS before it is due) and a thread sleeps until the earliest one.
+
+The queue is seeded with one indexed next_due range query covering the
+next resync interval, updated in place when payments are created or
+deleted in this process, polled every POLL_INTERVAL for payments created
+by other processes, and rebuilt every resync interval to pick up any
+other change. Only the holder of the reminders lease keeps a queue and
+fires reminders. After every rebuild the engine persists a cursor: all
+reminders whose window opened before it were sent, so a restarted (or
+newly elected) engine neither repeats them nor skips any it missed.
+"""
+import heapq
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from threading import Condition, Thread
+from typing import Dict
+from bson import ObjectId
+from config import scheduled_payments_collection, job_checkpoints_collection
+from models.schemas import Importance
+from services.agent_service import AgentService
+from services.leases import scheduler_leases, LEASE_TTL
+from services.payment_schedule import advance_due_dates, as_day, day_start, next_due_date
+
+# Reminders are created this many days before a payment is due
+REMINDER_DAYS = 3
+# Seconds between rebuilds of the queue from the database
+RESYNC_INTERVAL = float(os.getenv("REMINDER_RESYNC_INTERVAL", "900"))
+# Seconds between polls for payments created by other processes
+POLL_INTERVAL = float(os.getenv("REMINDER_POLL_INTERVAL", "30"))
+# Ids are generated by each writer's clock; polls overlap by this much
+POLL_CLOCK_SKEW = timedelta(seconds=60)
+
+LEASE_NAME = "scheduler:reminders"
+CURSOR_ID = "reminders:cursor"
+
+PAYMENT_FIELDS = {"user_id": 1, "amount": 1, "occurrence": 1, "particulars": 1,
+                  "importance": 1, "firstdate": 1, "next_due": 1}
+
+def reminder_time(due: date) -> datetime:
+    """When the reminder for a payment due on this day should be created"""
+    day = due - timedelta(days=REMINDER_DAYS)
+    return datetime.combine(day, dt_time(), tzinfo=timezone.utc)
+
+class ReminderEngine:
+    def __init__(self):
+        # (reminder time, payment id, due day); entries are dropped lazily
+        # when the payment was removed or has moved on to another due day
+        self._queue = []
+        self._payments = {}
+        # (payment id, due day) fired since the last persisted cursor
+        self._fired = set()
+        self._synced_at = None
+        # Monotonic time of the last poll, and the creation time it covered from
+        self._polled_at = None
+        self._poll_from = None
+        # Cursor the last rebuild started from
+        self._cursor = None
+        self._stopped = False
+        self._wakeup = Condition()
+        self._thread = None
+
+    def add_payment(self, payment: Dict) -> None:
+        """Queue a newly created payment's next reminder (leader only, others are polled)"""
+        if payment["importance"] != Importance.high.value or not scheduler_leases.holds(LEASE_NAME):
+            return
+        payment_id = str(payment["_id"])
+        payment = {field: payment[field] for field in PAYMENT_FIELDS if field in payment}
+        with self._wakeup:
+            self._push(payment_id, payment)
+            self._wakeup.notify()
+
+    def remove_payment(self, payment_id: str) -> None:
+        """Forget a deleted payment; its queued reminder is skipped"""
+        with self._wakeup:
+            self._payments.pop(payment_id, None)
+
+    def _push(self, payment_id: str, payment: Dict) -> None:
+        due = as_day(payment["next_due"])
+        self._payments[payment_id] = {**payment, "next_due": due}
+        heapq.heappush(self._queue, (reminder_time(due), payment_id, due))
+
+    def resync(self) -> None:
+        """Rebuild the queue from the database and persist the cursor"""
+        now = datetime.now(timezone.utc)
+        advance_due_dates(now.date())
+
+        checkpoint = job_checkpoints_collection.find_one({"_id": CURSOR_ID}) or {}
+        # First run ever: every open reminder window is still pending
+        cursor = checkpoint.get("cursor") or datetime.min.replace(tzinfo=timezone.utc)
+
+        # Only payments whose reminder window opens before the next resync
+        horizon = self._horizon(now)
+        payments = scheduled_payments_collection.find(
+            {"importance": Importance.high.value, "next_due": {"$lte": day_start(horizon.date())}},
+            PAYMENT_FIELDS
+        )
+
+        with self._wakeup:
+            self._queue = []
+            self._payments = {}
+            for payment in payments:
+                payment_id = str(payment.pop("_id"))
+                if not self._already_sent(payment_id, as_day(payment["next_due"]), cursor):
+                    self._push(payment_id, payment)
+
+        self._fire_due(now)
+        job_checkpoints_collection.update_one(
+            {"_id": CURSOR_ID}, {"$set": {"cursor": now}}, upsert=True
+        )
+        self._fired.clear()
+        self._synced_at = self._polled_at = time.monotonic()
+        self._poll_from = now - POLL_CLOCK_SKEW
+        self._cursor = cursor
+
+    def poll_new(self) -> None:
+        """Queue payments created (by any process) since the last poll"""
+        now = datetime.now(timezone.utc)
+        payments = scheduled_payments_collection.find(
+            {
+                "_id": {"$gte": ObjectId.from_datetime(self._poll_from)},
+                "importance": Importance.high.value,
+                "next_due": {"$lte": day_start(self._horizon(now).date())}
+            },
+            PAYMENT_FIELDS
+        )
+        with self._wakeup:
+            for payment in payments:
+                payment_id = str(payment.pop("_id"))
+                if (payment_id not in self._payments
+                        and not self._already_sent(payment_id, as_day(payment["next_due"]), self._cursor)):
+                    self._push(payment_id, payment)
+        self._polled_at = time.monotonic()
+        self._poll_from = now - POLL_CLOCK_SKEW
+
+    def _already_sent(self, payment_id: str, due: date, cursor: datetime) -> bool:
+        # Sent by an earlier run, unless the payment was created after that
+        # run persisted its cursor, or by this one
+        if reminder_time(due) <= cursor and ObjectId(payment_id).generation_time <= cursor:
+            return True
+        return (payment_id, due) in self._fired
+
+    @staticmethod
+    def _horizon(now: datetime) -> datetime:
+        """Due dates whose reminder window opens before the next resync"""
+        return now + timedelta(seconds=RESYNC_INTERVAL, days=REMINDER_DAYS)
+
+    def _clear(self) -> None:
+        """Drop the queue after losing the lease; the next leader rebuilds it"""
+        with self._wakeup:
+            self._queue = []
+            self._payments = {}
+        self._fired.clear()
+        self._synced_at = self._polled_at = None
+
+    def _fire_due(self, now: datetime) -> None:
+        """Create reminders for every queued entry whose window has opened"""
+        while True:
+            with self._wakeup:
+                if not self._queue or self._queue[0][0] > now:
+                    return
+                _, payment_id, due = heapq.heappop(self._queue)
+                payment = self._payments.get(payment_id)
+                if payment is None or payment["next_due"] != due:
+                    continue  # Deleted, or superseded by a newer entry
+                # Queue the following occurrence
+                next_due = next_due_date(
+                    payment["firstdate"], payment["occurrence"],
+                    due + timedelta(days=1)
+                )
+                self._push(payment_id, {**payment, "next_due": next_due})
+            self._fire(payment_id, due)
+
+    def _fire(self, payment_id: str, due: date) -> None:
+        # The payment may have been deleted by another process
+        payment = scheduled_payments_collection.find_one({"_id": ObjectId(payment_id)}, PAYMENT_FIELDS)
+        if payment is None:
+            with self._wakeup:
+                self._payments.pop(payment_id, None)
+            return
+        try:
+            AgentService.check_upcoming_payments(payment["user_id"], [{**payment, "next_due": due}])
+        except Exception as e:
+            print(f"Reminder failed for payment {payment_id}: {e}")
+        self._fired.add((payment_id, due))
+
+    def run(self) -> None:
+        """Fire reminders as their windows open while holding the lease"""
+        while not self._stopped:
+            if not scheduler_leases.holds(LEASE_NAME):
+                if self._synced_at is not None or self._queue:
+                    self._clear()
+                with self._wakeup:
+                    self._wakeup.wait(LEASE_TTL / 3)
+                continue
+
+            try:
+                if self._synced_at is None or time.monotonic() - self._synced_at >= RESYNC_INTERVAL:
+                    self.resync()
+                elif time.monotonic() - self._polled_at >= POLL_INTERVAL:
+                    self.poll_new()
+                self._fire_due(datetime.now(timezone.utc))
+            except Exception as e:
+                print(f"Reminder engine error: {e}")
+                self._synced_at = None
+
+            with self._wakeup:
+                timeout = RESYNC_INTERVAL - (time.monotonic() - (self._synced_at or time.monotonic()))
+                if self._polled_at is not None:
+                    timeout = min(timeout, POLL_INTERVAL - (time.monotonic() - self._polled_at))
+                if self._queue:
+                    until_next = (self._queue[0][0] - datetime.now(timezone.utc)).total_seconds()
+                    timeout = min(timeout, until_next)
+                if timeout > 0:
+                    self._wakeup.wait(timeout)
+
+    def start(self) -> None:
+        """Run the engine in a background thread"""
+        if self._thread is not None:
+            return
+        scheduler_leases.register(LEASE_NAME)
+        self._thread = Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+
+# Singleton instance
+reminder_engine = ReminderEngine()
@@ -0,0 +1,93 @@
+"""
+Monte Carlo shortfall probability
+Simulates each user's balance day by day over the payment schedule
+window. Every path draws a daily income level from the user's predictive
+distribution (one sample per forest tree) and day-to-day variation
+around it; a path falls short when the balance cannot cover a payment on
+the day it is due. All users of a batch are simulated together in numpy,
+chunked to bound memory.
+
+Day-to-day variation is drawn from a fixed bank of precomputed
+cumulative income paths, so a simulation costs one random index per path
+instead of one gamma draw per path and day.
+"""
+import os
+from typing import List, Optional
+import numpy as np
+
+# Simulated paths per user
+SIMULATION_PATHS = int(os.getenv("RISK_SIMULATION_PATHS", "2000"))
+# Gamma shape of daily income around its level (coefficient of variation 1/sqrt(shape))
+DAILY_INCOME_SHAPE = float(os.getenv("RISK_DAILY_INCOME_SHAPE", "2.0"))
+# Max simulated values held in memory at once (users x paths x days)
+MAX_CHUNK_ELEMENTS = int(os.getenv("RISK_SIMULATION_MAX_ELEMENTS", "4000000"))
+# Precomputed daily variation paths
+NOISE_BANK_SIZE = 16384
+
+_noise_banks = {}
+
+# (minimum probability, level), highest first
+RISK_LEVELS = [
+    (0.85, "critical"),
+    (0.60, "high"),
+    (0.35, "medium"),
+    (0.15, "low"),
+]
+
+def risk_level(probability: float) -> str:
+    for threshold, level in RISK_LEVELS:
+        if probability >= threshold:
+            return level
+    return "minimal"
+
+def _noise_bank(n_days: int) -> np.ndarray:
+    """
+    (NOISE_BANK_SIZE, n_days) income received before each day, per unit
+    of daily income level
+    """
+    bank = _noise_banks.get(n_days)
+    if bank is None:
+        rng = np.random.default_rng(0)
+        daily = rng.standard_gamma(DAILY_INCOME_SHAPE, size=(NOISE_BANK_SIZE, n_days)) / DAILY_INCOME_SHAPE
+        bank = (np.cumsum(daily, axis=1) - daily).astype(np.float32)
+        _noise_banks[n_days] = bank
+    return bank
+
+def shortfall_probabilities(balances: np.ndarray, income_samples: List[np.ndarray],
+                            schedules: np.ndarray, n_paths: int = SIMULATION_PATHS,
+                            seed: Optional[int] = None) -> np.ndarray:
+    """
+    Probability that each user's balance cannot cover a scheduled payment
+    balances: (n_users,) current balances
+    income_samples: per user, daily income predictions (one per tree)
+    schedules: (n_users, n_days) amounts due per day (see buffer_engine.payment_schedule)
+    """
+    rng = np.random.default_rng(seed)
+    n_users, n_days = schedules.shape
+    probabilities = np.zeros(n_users)
+    if n_users == 0:
+        return probabilities
+
+    # Ragged samples padded into one matrix; draws index within each row's length
+    lengths = np.array([len(samples) for samples in income_samples])
+    padded = np.zeros((n_users, lengths.max()))
+    for i, samples in enumerate(income_samples):
+        padded[i, :lengths[i]] = samples
+
+    # Balance needed on each day: payments up to and including that day,
+    # since a payment is due before that day's income arrives
+    needed = (np.cumsum(schedules, axis=1) - balances[:, None]).astype(np.float32)
+    bank = _noise_bank(n_days)
+    chunk = max(1, MAX_CHUNK_ELEMENTS // (n_paths * n_days))
+
+    for start in range(0, n_users, chunk):
+        users = slice(start, start + chunk)
+        size = len(lengths[users])
+
+        # Income level per path, then a daily variation path around it
+        draws = (rng.random((size, n_paths)) * lengths[users, None]).astype(np.int64)
+        levels = padded[users][np.arange(size)[:, None], draws].astype(np.float32)
+        income_before = levels[:, :, None] * bank[rng.integers(0, NOISE_BANK_SIZE, size=(size, n_paths))]
+        probabilities[users] = (income_before < needed[users, None, :]).any(axis=2).mean(axis=1)
+
+    return probabilities
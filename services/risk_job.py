@@ -0,0 +1,158 @@
+"""
+Offline payment-risk scoring for every user
+Users are split into _id-range shards that are scored in parallel worker
+processes. Each shard checkpoints the last user it scored, so running
+again with the same run id resumes a crashed run where it stopped:
+
+    python -m services.risk_job --workers 8 --shards 32
+    python -m services.risk_job --run-id 2025-11-29
+
+Scores are written to risk_scores only; --write-insights also sends the
+high-risk insights users would get from the live checks.
+"""
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List
+from pymongo import ASCENDING, UpdateOne
+from config import users_collection, risk_scores_collection, job_checkpoints_collection
+
+def plan_shards(run_id: str, n_shards: int) -> List[str]:
+    """
+    Create the checkpoint documents for a run, or return the unfinished
+    shards of an existing run
+    """
+    existing = list(job_checkpoints_collection.find({"run_id": run_id}, {"done": 1}))
+    if existing:
+        pending = [doc["_id"] for doc in existing if not doc.get("done")]
+        print(f"Resuming run {run_id}: {len(pending)} of {len(existing)} shards pending")
+        return pending
+
+    # Evenly sized _id ranges; each bucket's max is exclusive except the last
+    buckets = list(users_collection.aggregate([
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": n_shards}}
+    ]))
+    shards = [
+        {
+            "_id": f"{run_id}:{i}",
+            "run_id": run_id,
+            "shard": i,
+            "min_id": bucket["_id"]["min"],
+            "max_id": bucket["_id"]["max"],
+            "max_inclusive": i == len(buckets) - 1,
+            "last_id": None,
+            "scored": 0,
+            "done": False,
+            "updated_at": datetime.now(timezone.utc)
+        }
+        for i, bucket in enumerate(buckets)
+    ]
+    if shards:
+        job_checkpoints_collection.insert_many(shards)
+    print(f"Planned run {run_id}: {len(shards)} shards")
+    return [shard["_id"] for shard in shards]
+
+def score_shard(shard_id: str, batch_size: int, write_insights: bool = False) -> int:
+    """
+    Score every user in one shard, resuming after its checkpoint
+    Runs in a worker process; returns the number of users scored
+    """
+    # Imported here so each worker process loads the model once and the
+    # parent process never does
+    from services.agent_service import AgentService
+    from services.insight_sink import BufferedInsightSink
+
+    sink = BufferedInsightSink(shard_id) if write_insights else None
+
+    shard = job_checkpoints_collection.find_one({"_id": shard_id})
+    id_range = {"$lte" if shard["max_inclusive"] else "$lt": shard["max_id"]}
+    if shard["last_id"] is not None:
+        id_range["$gt"] = shard["last_id"]
+    else:
+        id_range["$gte"] = shard["min_id"]
+    scored = shard["scored"]
+
+    while True:
+        users = list(
+            users_collection.find({"_id": id_range}, {"_id": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not users:
+            break
+
+        user_ids = [str(user["_id"]) for user in users]
+        # One simulation for the whole batch
+        risks = AgentService.predict_payment_risk_batch(user_ids, sink, generate_insights=write_insights)
+        scored_at = datetime.now(timezone.utc)
+
+        operations = []
+        for user_id, risk in risks.items():
+            if "error" in risk:
+                continue  # No virtual account yet, or scoring this user failed (logged)
+            operations.append(UpdateOne(
+                {"_id": user_id},
+                {"$set": {**risk, "run_id": shard["run_id"], "scored_at": scored_at}},
+                upsert=True
+            ))
+
+        if operations:
+            risk_scores_collection.bulk_write(operations, ordered=False)
+        if sink is not None:
+            sink.flush()  # Insights too, before the checkpoint moves past them
+        scored += len(operations)
+
+        # Checkpoint only after the batch's results are written
+        id_range.pop("$gte", None)
+        id_range["$gt"] = users[-1]["_id"]
+        job_checkpoints_collection.update_one(
+            {"_id": shard_id},
+            {"$set": {
+                "last_id": users[-1]["_id"],
+                "scored": scored,
+                "updated_at": datetime.now(timezone.utc)
+            }}
+        )
+
+    job_checkpoints_collection.update_one({"_id": shard_id}, {"$set": {"done": True}})
+    return scored
+
+def run(run_id: str, workers: int, n_shards: int, batch_size: int, write_insights: bool = False) -> None:
+    """Score all pending shards of a run with a process pool"""
+    shard_ids = plan_shards(run_id, n_shards)
+    if not shard_ids:
+        print(f"Run {run_id} already complete")
+        return
+
+    # Spawned (not forked) workers each open their own MongoDB connection
+    context = multiprocessing.get_context("spawn")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(score_shard, shard_id, batch_size, write_insights): shard_id for shard_id in shard_ids}
+        for future in as_completed(futures):
+            shard_id = futures[future]
+            try:
+                print(f"Shard {shard_id} done ({future.result()} users scored)")
+            except Exception as e:
+                failed += 1
+                print(f"Shard {shard_id} failed: {e}")
+
+    if failed:
+        print(f"Run {run_id}: {failed} shards failed, rerun with --run-id {run_id} to resume")
+    else:
+        print(f"Run {run_id} complete")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score payment risk for every user")
+    parser.add_argument("--run-id", default=datetime.now(timezone.utc).date().isoformat(),
+                        help="Run identifier; reusing one resumes that run (default: today's date)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Number of _id-range shards (default: 4 per worker)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--write-insights", action="store_true",
+                        help="Also insert high-risk insights for the scored users")
+    args = parser.parse_args()
+
+    run(args.run_id, args.workers, args.shards or args.workers * 4, args.batch_size, args.write_insights)
@@ -3,33 +3,207 @@ Background scheduler for periodic agent tasks
 """
 import schedule
 import time
-from threading import Thread
-from config import users_collection
+import os
+import pymongo
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from threading import Lock, Thread
+from pymongo import ASCENDING, UpdateOne
+from config import users_collection, virtual_accounts_collection, scheduled_payments_collection
 from services.agent_service import AgentService
+from services.leases import scheduler_leases
+from services.buffer_engine import weekly_buffers
+from services.payment_schedule import advance_due_dates
+from services.reminders import reminder_engine
+from services.insight_sink import BufferedInsightSink
 
-def update_all_buffers():
-    """Update buffers for all users"""
-    users = users_collection.find({})
-    for user in users:
-        user_id = str(user["_id"])
+# Users processed per round trip in the nightly sweep
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+
+# Threads shared by all jobs for per-user agent checks (the work is
+# database-bound, so threads keep the connection pool busy)
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+# Default max per-user checks a single job keeps in flight (see run_for_users)
+JOB_CONCURRENCY = int(os.getenv("SCHEDULER_JOB_CONCURRENCY", "8"))
+# Seconds a single user's checks may take; their MongoDB operations are
+# cancelled past it
+USER_TIMEOUT = float(os.getenv("SCHEDULER_USER_TIMEOUT", "30"))
+
+user_pool = ThreadPoolExecutor(max_workers=SCHEDULER_WORKERS, thread_name_prefix="agent-check")
+job_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="scheduler-job")
+
+# Jobs in the same group never run at the same time
+_group_locks = defaultdict(Lock)
+
+# Timed-out checks whose threads are still running, across all jobs
+_stuck_checks = set()
+_stuck_lock = Lock()
+
+def run_job(name: str, func, group: str = None):
+    """
+    Start a job on the job pool unless a job of the same group is running
+    Keeps the schedule loop free and prevents overlapping runs. Only the
+    process holding the job's lease runs it (see services/leases.py).
+    """
+    if not scheduler_leases.holds(f"scheduler:{name}"):
+        print(f"[{name}] skipped: lease held by another process")
+        return
+    
+    lock = _group_locks[group or name]
+    if not lock.acquire(blocking=False):
+        print(f"[{name}] skipped: previous run still in progress")
+        return
+    
+    def execute():
+        started = time.monotonic()
         try:
-            AgentService.update_buffer_for_user(user_id)
-            AgentService.check_balance_risk(user_id)
-            AgentService.check_upcoming_payments(user_id)
-            print(f"Updated agent checks for user {user_id}")
+            func()
+            print(f"[{name}] finished in {time.monotonic() - started:.1f}s")
         except Exception as e:
-            print(f"Error updating user {user_id}: {e}")
+            print(f"[{name}] failed: {e}")
+        finally:
+            lock.release()
+    
+    job_pool.submit(execute)
+
+def _release_stuck(future):
+    with _stuck_lock:
+        _stuck_checks.discard(future)
+
+def run_for_users(name: str, user_ids, check, concurrency: int = JOB_CONCURRENCY) -> int:
+    """
+    Run check(user_id) for each user on the shared pool with at most
+    concurrency of this job's checks in flight
+    Each check runs under a pymongo timeout of USER_TIMEOUT counted from
+    when it starts, so its database calls fail instead of hanging. Checks
+    still running past it are reported and no longer waited for; if such
+    checks occupy every pool thread the job stops instead of queueing work
+    behind them.
+    Returns the number of users that timed out.
+    """
+    # future -> (user_id, [start time, set by the worker])
+    in_flight = {}
+    timed_out = 0
+    
+    def run_check(user_id, started):
+        started.append(time.monotonic())
+        with pymongo.timeout(USER_TIMEOUT):
+            return check(user_id)
+    
+    def reap():
+        nonlocal timed_out
+        starts = [started[0] for _, started in in_flight.values() if started]
+        # Nothing started yet: look again after a timeout's worth of waiting
+        deadline = min(starts) + USER_TIMEOUT if starts else time.monotonic() + USER_TIMEOUT
+        done, _ = wait(in_flight, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            user_id, _ = in_flight.pop(future)
+            if future.exception():
+                print(f"[{name}] error for user {user_id}: {future.exception()}")
+        now = time.monotonic()
+        for future, (user_id, started) in list(in_flight.items()):
+            if started and now - started[0] >= USER_TIMEOUT:
+                in_flight.pop(future)
+                timed_out += 1
+                print(f"[{name}] user {user_id} timed out after {USER_TIMEOUT:g}s")
+                with _stuck_lock:
+                    _stuck_checks.add(future)
+                future.add_done_callback(_release_stuck)
+        
+        with _stuck_lock:
+            stuck = len(_stuck_checks)
+        if stuck >= SCHEDULER_WORKERS:
+            for future in list(in_flight):
+                if future.cancel():
+                    in_flight.pop(future)
+            raise RuntimeError(
+                f"{stuck} timed-out checks hold every pool thread ({timed_out} users timed out in this run)"
+            )
+    
+    for user_id in user_ids:
+        while len(in_flight) >= concurrency:
+            reap()
+        started = []
+        in_flight[user_pool.submit(run_check, user_id, started)] = (user_id, started)
+    while in_flight:
+        reap()
+    if timed_out:
+        print(f"[{name}] {timed_out} users timed out")
+    return timed_out
+
+def iter_user_batches(batch_size: int = SWEEP_BATCH_SIZE):
+    """Yield lists of user ids in _id order, one query per batch"""
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        users = list(
+            users_collection.find(query, {"_id": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not users:
+            return
+        last_id = users[-1]["_id"]
+        yield [str(user["_id"]) for user in users]
+
+def update_all_buffers():
+    """
+    Update buffers for all users
+    Per batch: one query each for scheduled payments and accounts,
+    one bulk_write for the new buffers, then the balance checks reuse
+    the fetched accounts. Payment reminders are sent by the reminder
+    engine (services/reminders.py) as they fall due.
+    """
+    advance_due_dates()
+    sink = BufferedInsightSink("update_all_buffers")
+    try:
+        for user_ids in iter_user_batches():
+            payments_by_user = defaultdict(list)
+            for payment in scheduled_payments_collection.find(
+                {"user_id": {"$in": user_ids}},
+                {"user_id": 1, "amount": 1, "occurrence": 1, "firstdate": 1, "next_due": 1}
+            ):
+                payments_by_user[payment["user_id"]].append(payment)
+            
+            accounts = {
+                account["user_id"]: account
+                for account in virtual_accounts_collection.find(
+                    {"user_id": {"$in": user_ids}},
+                    {"user_id": 1, "balance": 1, "buffer": 1}
+                )
+            }
+            
+            # Every buffer in the batch in one vectorized pass
+            buffers = weekly_buffers(
+                [payment for payments in payments_by_user.values() for payment in payments],
+                datetime.now(timezone.utc)
+            )
+            operations = []
+            for user_id, account in accounts.items():
+                account["buffer"] = buffers.get(user_id, 0.0)
+                operations.append(UpdateOne({"_id": account["_id"]}, {"$set": {"buffer": account["buffer"]}}))
+            if operations:
+                virtual_accounts_collection.bulk_write(operations, ordered=False)
+            
+            run_for_users(
+                "update_all_buffers",
+                list(accounts),
+                lambda user_id: AgentService.check_balance_risk(user_id, accounts[user_id], sink)
+            )
+            print(f"Updated agent checks for {len(user_ids)} users")
+    finally:
+        sink.flush()
 
 def run_scheduler():
     """Run scheduled tasks in background thread"""
-    # Update buffers daily at midnight
-    schedule.every().day.at("00:00").do(update_all_buffers)
+    scheduler_leases.register("scheduler:update_all_buffers")
+    # Payment reminders fire from the reminder engine as they fall due
+    reminder_engine.start()
+    scheduler_leases.start_heartbeat()
     
-    # Check payment reminders every 6 hours
-    schedule.every(6).hours.do(lambda: [
-        AgentService.check_upcoming_payments(str(u["_id"])) 
-        for u in users_collection.find({})
-    ])
+    # Update buffers daily at midnight
+    schedule.every().day.at("00:00").do(run_job, "update_all_buffers", update_all_buffers, "agent_checks")
     
     while True:
         schedule.run_pending()
@@ -40,3 +214,8 @@ def start_background_tasks():
     scheduler_thread = Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
     print("Background scheduler started")
+
+def stop_background_tasks():
+    """Hand scheduler leases to another process on shutdown"""
+    reminder_engine.stop()
+    scheduler_leases.release_all()
@@ -0,0 +1,192 @@
+"""
+Bulk transaction import
+Rows from NDJSON or CSV exports are validated with TransactionModel in
+chunks. Per chunk every account's balance moves with one net $inc and the
+rows are written with one insert_many(ordered=False). Income features and
+agent checks are refreshed once per affected account when the import ends.
+"""
+import codecs
+import csv
+import json
+import os
+from collections import defaultdict
+from typing import Dict, List
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from config import transactions_collection, virtual_accounts_collection
+from models.schemas import TransactionModel, TransactionType
+from services.agent_events import agent_events
+from services.income_features import income_features
+
+# Rows validated and written per round trip
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+# Row errors included in the response
+MAX_REPORTED_ERRORS = 1000
+
+class TransactionImport:
+    """
+    State of one import: split the body's bytes into records with
+    split_records (and end_records at the end of the body), feed them with
+    feed_records, then call finish
+    CSV bodies start with a header row naming TransactionModel fields
+    """
+
+    def __init__(self, csv_format: bool = False):
+        self.csv_format = csv_format
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self._header = None
+        self._row = 0
+        self._chunk = []
+        # acct_id -> user_id, or None for unknown accounts
+        self._accounts = {}
+        self._affected = {}
+        # Body text after the last complete record, carried across chunks
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._partial = ""
+
+    def split_records(self, data: bytes) -> List[str]:
+        """
+        Complete records in the next chunk of the body
+        A CSV record ends at a newline outside quotes, so quoted fields may
+        span lines; an NDJSON record is one line
+        """
+        text = self._partial + self._decoder.decode(data)
+        records = []
+        begin = search = 0
+        while True:
+            end = text.find("\n", search)
+            if end < 0:
+                break
+            search = end + 1
+            record = text[begin:end]
+            # An odd number of quotes means the newline is inside a quoted field
+            if self.csv_format and record.count('"') % 2:
+                continue
+            records.append(record.rstrip("\r"))
+            begin = search
+        self._partial = text[begin:]
+        return records
+
+    def end_records(self) -> List[str]:
+        """The last record, at the end of the body"""
+        record = self._partial + self._decoder.decode(b"", final=True)
+        self._partial = ""
+        return [record.rstrip("\r")]
+
+    def feed_records(self, records: List[str]) -> None:
+        """Parse and buffer records of the body, writing full chunks"""
+        for record in records:
+            if self.csv_format and self._header is None:
+                self._header = next(csv.reader([record.lstrip("\ufeff")]), [])
+                continue
+            if not record.strip():
+                continue
+            self._row += 1
+            self.parse_record(record, self._row)
+
+    def parse_record(self, record: str, row: int) -> None:
+        """Parse one NDJSON line or CSV record"""
+        try:
+            if self.csv_format:
+                values = next(csv.reader([record]))
+                # Empty CSV cells are missing values
+                data = {key: value for key, value in zip(self._header, values) if value != ""}
+            else:
+                data = json.loads(record)
+        except (ValueError, StopIteration) as e:
+            self._error(row, f"Malformed row: {e}")
+            return
+        self.add_row(data, row)
+
+    def add_row(self, data: Dict, row: int) -> None:
+        try:
+            transaction = TransactionModel(**data)
+        except (ValidationError, TypeError) as e:
+            self._error(row, str(e))
+            return
+        self._chunk.append((row, transaction.model_dump()))
+        if len(self._chunk) >= IMPORT_CHUNK_SIZE:
+            self.flush()
+
+    def _error(self, row: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def _resolve_accounts(self, acct_ids: List[str]) -> None:
+        """Look up accounts not seen in earlier chunks with one query"""
+        new_ids = [acct_id for acct_id in set(acct_ids) if acct_id not in self._accounts]
+        object_ids = []
+        for acct_id in new_ids:
+            self._accounts[acct_id] = None
+            try:
+                object_ids.append(ObjectId(acct_id))
+            except (InvalidId, TypeError):
+                pass
+        if object_ids:
+            for account in virtual_accounts_collection.find({"_id": {"$in": object_ids}}, {"user_id": 1}):
+                self._accounts[str(account["_id"])] = account["user_id"]
+
+    def flush(self) -> None:
+        """Apply the buffered chunk"""
+        chunk, self._chunk = self._chunk, []
+        if not chunk:
+            return
+        self._resolve_accounts([tx["acct_id"] for _, tx in chunk])
+
+        rows_by_acct = defaultdict(list)
+        for row, tx in chunk:
+            if self._accounts[tx["acct_id"]] is None:
+                self._error(row, "Virtual account not found")
+            else:
+                rows_by_acct[tx["acct_id"]].append((row, tx))
+
+        # One net balance change per account; a net withdrawal must be covered
+        accepted = []
+        for acct_id, rows in rows_by_acct.items():
+            net = sum(
+                tx["amount"] if tx["type"] == TransactionType.deposit.value else -tx["amount"]
+                for _, tx in rows
+            )
+            account_filter = {"_id": ObjectId(acct_id)}
+            if net < 0:
+                account_filter["balance"] = {"$gte": -net}
+            if virtual_accounts_collection.update_one(account_filter, {"$inc": {"balance": net}}).matched_count:
+                accepted.extend(rows)
+            else:
+                for row, _ in rows:
+                    self._error(row, "Insufficient balance for this chunk's net withdrawals")
+
+        if not accepted:
+            return
+        failed_indexes = set()
+        try:
+            transactions_collection.insert_many([tx for _, tx in accepted], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details["writeErrors"]:
+                failed_indexes.add(error["index"])
+                self._error(accepted[error["index"]][0], error["errmsg"])
+
+        # Revert the balance change of rows that failed to insert
+        reverts = defaultdict(float)
+        for i, (_, tx) in enumerate(accepted):
+            if i in failed_indexes:
+                reverts[tx["acct_id"]] -= tx["amount"] if tx["type"] == TransactionType.deposit.value else -tx["amount"]
+            else:
+                self.imported += 1
+                self._affected[tx["acct_id"]] = self._accounts[tx["acct_id"]]
+        for acct_id, amount in reverts.items():
+            virtual_accounts_collection.update_one({"_id": ObjectId(acct_id)}, {"$inc": {"balance": amount}})
+
+    def finish(self) -> Dict:
+        """Write the last chunk, refresh affected accounts and summarize"""
+        self.flush()
+        if self._affected:
+            income_features.rebuild(self._affected)
+            for user_id in set(self._affected.values()):
+                agent_events.publish(user_id)
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
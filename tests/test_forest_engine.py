@@ -0,0 +1,37 @@
+import numpy as np
+from sklearn.ensemble import RandomForestRegressor
+from services.forest_engine import ForestEngine
+
+def fit_forest(seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(400, 6)) * 1000
+    # Integer-valued features put thresholds on exact midpoints
+    X[:, :2] = rng.integers(0, 20, size=(400, 2))
+    y = X[:, 0] * 3 + np.sin(X[:, 2] / 100) * 50 + rng.normal(size=400)
+    forest = RandomForestRegressor(n_estimators=25, max_depth=12, random_state=seed).fit(X, y)
+    return forest, rng
+
+def test_matches_sklearn_on_random_inputs():
+    forest, rng = fit_forest()
+    engine = ForestEngine.from_sklearn(forest)
+    X = rng.normal(size=(2000, 6)) * 1000
+    X[:, :2] = rng.integers(-2, 22, size=(2000, 2))
+    assert np.allclose(engine.predict(X), forest.predict(X), rtol=1e-9, atol=1e-9)
+
+def test_matches_sklearn_on_split_thresholds():
+    forest, rng = fit_forest(1)
+    engine = ForestEngine.from_sklearn(forest)
+    # Inputs exactly on sklearn's float64 thresholds and on their float32 roundings
+    thresholds = np.concatenate([
+        estimator.tree_.threshold[estimator.tree_.children_left != -1] for estimator in forest.estimators_
+    ])
+    for values in (thresholds, thresholds.astype(np.float32)):
+        X = rng.choice(values, size=(2000, forest.n_features_in_))
+        assert np.allclose(engine.predict(X), forest.predict(X), rtol=1e-9, atol=1e-9)
+
+def test_predict_trees_matches_each_estimator():
+    forest, rng = fit_forest(2)
+    engine = ForestEngine.from_sklearn(forest)
+    X = rng.normal(size=(300, 6)) * 1000
+    expected = np.stack([estimator.predict(X) for estimator in forest.estimators_], axis=1)
+    assert np.allclose(engine.predict_trees(X), expected, rtol=1e-9, atol=1e-9)
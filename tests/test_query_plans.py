@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from config import create_indexes
+from utils.query_plans import (
+    QUERY_PLAN_DB, QUERY_PLAN_MONGO_URL, SEED_USERS,
+    seed, query_shapes, explain, plan_stages, plan_problems
+)
+
+# Shape names only; the plans are checked against the seeded data
+SHAPE_NAMES = [
+    shape["name"]
+    for shape in query_shapes(
+        {
+            "users": [str(ObjectId()) for _ in range(SEED_USERS)],
+            "user_ids": [ObjectId() for _ in range(SEED_USERS)],
+            "acct_ids": [str(ObjectId()) for _ in range(SEED_USERS)]
+        },
+        datetime.now(timezone.utc)
+    )
+]
+
+@pytest.fixture(scope="module")
+def shapes():
+    client = MongoClient(QUERY_PLAN_MONGO_URL, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        pytest.skip(f"no mongod reachable at {QUERY_PLAN_MONGO_URL}")
+
+    client.drop_database(QUERY_PLAN_DB)
+    database = client[QUERY_PLAN_DB]
+    now = datetime.now(timezone.utc)
+    data = seed(database, now)
+    create_indexes(database)
+    yield database, {shape["name"]: shape for shape in query_shapes(data, now)}
+    client.drop_database(QUERY_PLAN_DB)
+    client.close()
+
+@pytest.mark.parametrize("name", SHAPE_NAMES)
+def test_query_uses_index_without_in_memory_sort(shapes, name):
+    database, by_name = shapes
+    stages = plan_stages(explain(database, by_name[name]))
+    assert not plan_problems(stages), f"{name}: {sorted(stages)}"
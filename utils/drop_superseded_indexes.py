@@ -0,0 +1,52 @@
+"""
+Drop the single-field indexes replaced by the compound ones in
+config.create_indexes
+A one-off migration, kept out of app startup so workers never drop indexes
+that older workers of a rolling deploy still use. Run it once every worker
+runs the code that creates the replacements:
+
+    python -m utils.drop_superseded_indexes --dry-run
+    python -m utils.drop_superseded_indexes
+"""
+import argparse
+from config import db
+
+# collection -> index names
+SUPERSEDED_INDEXES = {
+    "transactions": ["acct_id_1", "datetime_-1"],
+    "scheduled_payments": ["user_id_1"],
+    "insights": ["user_id_1", "created_at_-1", "read_1"],
+}
+
+# Compound indexes that must exist before the old ones go
+REPLACEMENTS = {
+    "transactions": ["acct_id_1_type_1_datetime_1", "acct_id_1_datetime_-1__id_-1"],
+    "scheduled_payments": ["user_id_1_importance_1_next_due_1", "next_due_1"],
+    "insights": ["user_id_1_created_at_-1__id_-1", "user_id_1_read_1_created_at_-1__id_-1"],
+}
+
+def drop_superseded(name: str, dry_run: bool) -> int:
+    """Drop one collection's superseded indexes; returns the indexes dropped"""
+    existing = db[name].index_information()
+    missing = [index_name for index_name in REPLACEMENTS[name] if index_name not in existing]
+    if missing:
+        print(f"{name}: skipped, replacement indexes missing: {', '.join(missing)}")
+        return 0
+
+    dropped = 0
+    for index_name in SUPERSEDED_INDEXES[name]:
+        if index_name not in existing:
+            continue
+        if not dry_run:
+            db[name].drop_index(index_name)
+        dropped += 1
+        print(f"{name}: {'would drop' if dry_run else 'dropped'} {index_name}")
+    return dropped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop indexes replaced by compound indexes")
+    parser.add_argument("--dry-run", action="store_true", help="List indexes without dropping them")
+    args = parser.parse_args()
+
+    for name in SUPERSEDED_INDEXES:
+        drop_superseded(name, args.dry_run)
@@ -1,8 +1,15 @@
 """
 Helper utility functions
 """
-from bson import ObjectId
-from fastapi import HTTPException
+import base64
+import os
+import secrets
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId, json_util
+from fastapi import Header, HTTPException
+
+# Largest page the list endpoints return
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "500"))
 
 def convert_objectid(doc):
     """Convert MongoDB ObjectId to string for JSON serialization"""
@@ -16,3 +23,62 @@ def validate_objectid(id_str: str) -> ObjectId:
         return ObjectId(id_str)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ID format")
+
+def require_admin_key(x_admin_key: Optional[str] = Header(None)) -> None:
+    """
+    Dependency for operational endpoints: the X-Admin-Key header must match
+    ADMIN_API_KEY. Without ADMIN_API_KEY these endpoints are disabled.
+    """
+    admin_key = os.getenv("ADMIN_API_KEY")
+    if not admin_key:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_KEY not set)")
+    if x_admin_key is None or not secrets.compare_digest(x_admin_key.encode(), admin_key.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+def encode_cursor(values: List) -> str:
+    """Opaque page cursor holding the sort key values of the last item"""
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+def decode_cursor(cursor: str) -> List:
+    """Sort key values from a page cursor"""
+    try:
+        return json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_query(query: Dict, sort: List[Tuple[str, int]], values: List) -> Dict:
+    """
+    query restricted to documents strictly after the sort key values
+    The leading range on the first sort field gives the index scan a
+    bound; the $or breaks ties on the remaining fields.
+    """
+    fields = [field for field, _ in sort]
+    after = []
+    for i, (field, direction) in enumerate(sort):
+        clause = dict(zip(fields[:i], values[:i]))
+        clause[field] = {"$gt" if direction > 0 else "$lt": values[i]}
+        after.append(clause)
+    first, direction = sort[0]
+    bound = {first: {"$gte" if direction > 0 else "$lte": values[0]}}
+    return {"$and": [query, bound, {"$or": after}]}
+
+def keyset_page(collection, query: Dict, sort: List[Tuple[str, int]], cursor: str, limit: int) -> Tuple[List[Dict], Optional[str]]:
+    """
+    One page of query results ordered by sort, continuing after cursor
+    (empty cursor = first page). sort must end with _id so keys are unique.
+    Each page is an index range scan, however deep, unlike skip().
+    Returns (documents, next_cursor or None on the last page)
+    """
+    fields = [field for field, _ in sort]
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(sort):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = keyset_query(query, sort, values)
+
+    docs = list(collection.find(query).sort(sort).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if not has_more or not docs:
+        return docs, None
+    return docs, encode_cursor([docs[-1].get(field) for field in fields])
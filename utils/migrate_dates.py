@@ -0,0 +1,83 @@
+"""
+Migrate time fields stored as ISO strings to BSON dates
+Streams each collection in _id order, converting only documents whose
+field is still a string, so it is safe to rerun and to run against a
+live database (a document changed meanwhile is left for the next run).
+Run it before deploying code that reads the fields as dates:
+
+    python -m utils.migrate_dates
+    python -m utils.migrate_dates --dry-run
+"""
+import argparse
+from datetime import date, datetime, timezone
+from typing import Callable
+from pymongo import ASCENDING, UpdateOne
+from config import db
+from services.payment_schedule import day_start
+
+def parse_timestamp(value: str) -> datetime:
+    """ISO 8601 timestamp; values without an offset were written in UTC"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+def parse_day(value: str) -> datetime:
+    """YYYY-MM-DD day, stored as UTC midnight"""
+    return day_start(date.fromisoformat(value[:10]))
+
+# (collection, field, parser)
+DATE_FIELDS = [
+    ("transactions", "datetime", parse_timestamp),
+    ("insights", "created_at", parse_timestamp),
+    ("scheduled_payments", "firstdate", parse_day),
+    ("scheduled_payments", "next_due", parse_day),
+    ("risk_scores", "scored_at", parse_timestamp),
+    ("job_checkpoints", "updated_at", parse_timestamp),
+    ("job_checkpoints", "cursor", parse_timestamp),
+    ("agent_events", "queued_at", parse_timestamp),
+]
+
+def migrate_field(name: str, field: str, parse: Callable, batch_size: int, dry_run: bool) -> int:
+    """Convert one field of one collection; returns the documents converted"""
+    collection = db[name]
+    converted = 0
+    failed = 0
+    last_id = None
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        docs = list(collection.find(query, {field: 1}).sort("_id", ASCENDING).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        operations = []
+        for doc in docs:
+            try:
+                value = parse(doc[field])
+            except ValueError:
+                failed += 1
+                print(f"{name}.{field}: cannot parse {doc[field]!r} of {doc['_id']}")
+                continue
+            # Matching the old value leaves documents rewritten meanwhile alone
+            operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+
+        if operations and not dry_run:
+            converted += collection.bulk_write(operations, ordered=False).modified_count
+        else:
+            converted += len(operations)
+
+    action = "would convert" if dry_run else "converted"
+    print(f"{name}.{field}: {action} {converted} documents ({failed} unparseable)")
+    return converted
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ISO string time fields to BSON dates")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="Count documents without writing")
+    args = parser.parse_args()
+
+    for name, field, parse in DATE_FIELDS:
+        migrate_field(name, field, parse, args.batch_size, args.dry_run)
@@ -0,0 +1,244 @@
+"""
+Query plan check
+Runs every query shape the routes and services issue, with explain(),
+against a scratch database on a local mongod built with
+config.create_indexes. Each winning plan must read an index and must not
+sort in memory. tests/test_query_plans.py fails on any regression (and is
+skipped when no mongod is reachable); run directly, the check prints every
+plan and exits with 1 on a regression.
+
+    QUERY_PLAN_MONGO_URL=mongodb://localhost:27017 python -m pytest tests/test_query_plans.py
+    QUERY_PLAN_MONGO_URL=mongodb://localhost:27017 python -m utils.query_plans
+
+When adding a query to the code, add its shape to query_shapes.
+"""
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Set
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from config import create_indexes
+from services.income_features import deposits_pipeline, deposit_totals_pipeline
+from services.payment_schedule import day_start, due_window
+from utils.helpers import keyset_query
+
+QUERY_PLAN_MONGO_URL = os.getenv("QUERY_PLAN_MONGO_URL", "mongodb://localhost:27017")
+QUERY_PLAN_DB = os.getenv("QUERY_PLAN_DB", "safebalance_query_plans")
+SEED_USERS = 200
+
+TRANSACTION_SORT = [("datetime", DESCENDING), ("_id", DESCENDING)]
+INSIGHT_SORT = [("created_at", DESCENDING), ("_id", DESCENDING)]
+
+def seed(database, now: datetime) -> Dict:
+    """Fill the scratch database with a little data of every shape"""
+    rng = random.Random(0)
+    today = now.date()
+    user_ids = [ObjectId() for _ in range(SEED_USERS)]
+    database["users"].insert_many([
+        {"_id": user_id, "phone": f"9{i:09d}", "aadhaar": f"{i:012d}"}
+        for i, user_id in enumerate(user_ids)
+    ])
+    users = [str(user_id) for user_id in user_ids]
+    accounts = [
+        {"_id": ObjectId(), "user_id": user_id, "balance": rng.uniform(0, 5000), "buffer": 0.0}
+        for user_id in users
+    ]
+    database["virtual_accounts"].insert_many(accounts)
+    acct_ids = [str(account["_id"]) for account in accounts]
+
+    database["transactions"].insert_many([
+        {
+            "acct_id": rng.choice(acct_ids),
+            "type": rng.choice(["deposit", "withdrawal"]),
+            "amount": rng.uniform(10, 1000),
+            "datetime": now - timedelta(days=rng.uniform(0, 90))
+        }
+        for _ in range(20 * SEED_USERS)
+    ])
+    database["scheduled_payments"].insert_many([
+        {
+            "user_id": rng.choice(users),
+            "amount": rng.uniform(100, 2000),
+            "occurrence": rng.choice(["weekly", "monthly", "annual"]),
+            "importance": rng.choice(["high", "normal"]),
+            "firstdate": day_start(today - timedelta(days=rng.randint(0, 365))),
+            "next_due": day_start(today + timedelta(days=rng.randint(0, 30)))
+        }
+        for _ in range(3 * SEED_USERS)
+    ])
+    database["insights"].insert_many([
+        {
+            "user_id": rng.choice(users),
+            "type": rng.choice(["payment_due_soon", "buffer_breach", "income_volatility_alert"]),
+            "read": rng.random() < 0.5,
+            "created_at": now - timedelta(days=rng.uniform(0, 60))
+        }
+        for _ in range(10 * SEED_USERS)
+    ])
+    database["questionnaires"].insert_many([{"user_id": user_id, "a1": "A"} for user_id in users])
+    database["income_features"].insert_many([{"user_id": user_id, "deposits": [], "deposits_complete": True} for user_id in users])
+    database["job_checkpoints"].insert_many([{"run_id": "seed", "done": True} for _ in range(10)])
+    database["agent_events"].insert_many([
+        {"_id": user_id, "queued_at": now, "owner": f"seed:{i % 4}", "expires_at": now + timedelta(seconds=60)}
+        for i, user_id in enumerate(users)
+    ])
+    return {"users": users, "user_ids": user_ids, "acct_ids": acct_ids}
+
+def query_shapes(data: Dict, now: datetime) -> List[Dict]:
+    """
+    Every filter (+ sort) the code sends, with sample values
+    A shape with a pipeline is checked by its leading $match and $sort
+    stages, the part an index can serve
+    """
+    users, acct_ids = data["users"], data["acct_ids"]
+    today = now.date()
+    return [
+        # routes/users.py, services/scheduler.py (iter_user_batches)
+        {"name": "users by phone or aadhaar", "collection": "users",
+         "filter": {"$or": [{"phone": "9000000001"}, {"aadhaar": "000000000001"}]}},
+        {"name": "users keyset page", "collection": "users",
+         "filter": keyset_query({}, [("_id", ASCENDING)], [data["user_ids"][50]]),
+         "sort": [("_id", ASCENDING)]},
+        {"name": "user id batch", "collection": "users",
+         "filter": {"_id": {"$gt": data["user_ids"][50]}}, "sort": [("_id", ASCENDING)]},
+        # services/agent_service.py, services/scheduler.py, services/ml_service.py
+        {"name": "accounts of users", "collection": "virtual_accounts",
+         "filter": {"user_id": {"$in": users[:50]}}},
+        {"name": "questionnaires of users", "collection": "questionnaires",
+         "filter": {"user_id": {"$in": users[:50]}}},
+        {"name": "complete income features", "collection": "income_features",
+         "filter": {"user_id": {"$in": users[:50]}, "deposits_complete": True}},
+        # services/income_features.py (aggregate_deposits)
+        {"name": "deposits per account since cutoff", "collection": "transactions",
+         "pipeline": deposits_pipeline(acct_ids[:50], now - timedelta(days=30))},
+        # services/ml_service.py (fallback predictions)
+        {"name": "deposit totals per account since cutoff", "collection": "transactions",
+         "pipeline": deposit_totals_pipeline(acct_ids[:50], now - timedelta(days=30))},
+        # routes/transactions.py
+        {"name": "account history", "collection": "transactions",
+         "filter": {"acct_id": acct_ids[0]}, "sort": [("datetime", DESCENDING)]},
+        {"name": "account history keyset page", "collection": "transactions",
+         "filter": keyset_query({"acct_id": acct_ids[0]}, TRANSACTION_SORT, [now, ObjectId()]),
+         "sort": TRANSACTION_SORT},
+        # services/agent_service.py, services/scheduler.py, routes/scheduled_payments.py
+        {"name": "payments of users", "collection": "scheduled_payments",
+         "filter": {"user_id": {"$in": users[:50]}}},
+        {"name": "high importance payments due in 1-3 days", "collection": "scheduled_payments",
+         "filter": {"user_id": users[0], "importance": "high", "next_due": due_window(today, 1, 3)}},
+        # services/reminders.py, services/payment_schedule.py
+        {"name": "reminder horizon", "collection": "scheduled_payments",
+         "filter": {"importance": "high", "next_due": {"$lte": day_start(today + timedelta(days=4))}}},
+        {"name": "high importance payments created since", "collection": "scheduled_payments",
+         "filter": {"_id": {"$gte": ObjectId.from_datetime(now - timedelta(minutes=1))}, "importance": "high",
+                    "next_due": {"$lte": day_start(today + timedelta(days=4))}}},
+        {"name": "passed due dates", "collection": "scheduled_payments",
+         "filter": {"$or": [{"next_due": {"$lt": day_start(today)}}, {"next_due": None}]}},
+        # routes/insights.py
+        {"name": "user insights", "collection": "insights",
+         "filter": {"user_id": users[0]}, "sort": [("created_at", DESCENDING)]},
+        {"name": "unread user insights", "collection": "insights",
+         "filter": {"user_id": users[0], "read": False}, "sort": [("created_at", DESCENDING)]},
+        {"name": "user insights keyset page", "collection": "insights",
+         "filter": keyset_query({"user_id": users[0]}, INSIGHT_SORT, [now, ObjectId()]),
+         "sort": INSIGHT_SORT},
+        {"name": "unread user insights keyset page", "collection": "insights",
+         "filter": keyset_query({"user_id": users[0], "read": False}, INSIGHT_SORT, [now, ObjectId()]),
+         "sort": INSIGHT_SORT},
+        # services/risk_job.py
+        {"name": "job checkpoints of a run", "collection": "job_checkpoints",
+         "filter": {"run_id": "seed"}},
+        # services/agent_events.py
+        {"name": "agent events of an owner", "collection": "agent_events",
+         "filter": {"owner": "seed:0"}},
+        {"name": "expired agent events", "collection": "agent_events",
+         "filter": {"$or": [{"expires_at": {"$lt": now}}, {"expires_at": {"$exists": False}}]}},
+    ]
+
+def plan_stages(node, stages: Set[str] = None) -> Set[str]:
+    """Stage names of every winning plan in an explain document"""
+    if stages is None:
+        stages = set()
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                _collect_stages(value, stages)
+            elif key == "$sort":
+                # Aggregation $sort the query layer could not absorb into its plan
+                stages.add("SORT")
+            else:
+                plan_stages(value, stages)
+    elif isinstance(node, list):
+        for value in node:
+            plan_stages(value, stages)
+    return stages
+
+def _collect_stages(node, stages: Set[str]) -> None:
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            stages.add(node["stage"])
+        for value in node.values():
+            _collect_stages(value, stages)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_stages(value, stages)
+
+def plan_problems(stages: Set[str]) -> List[str]:
+    """Why a plan is rejected (empty when it is fine)"""
+    problems = []
+    if not any("IXSCAN" in stage or "IDHACK" in stage for stage in stages):
+        problems.append("no index scan")
+    if "COLLSCAN" in stages:
+        problems.append("collection scan")
+    if "SORT" in stages:
+        problems.append("in-memory sort")
+    return problems
+
+def explain(database, shape: Dict) -> Dict:
+    collection = database[shape["collection"]]
+    if "pipeline" in shape:
+        leading = []
+        for stage in shape["pipeline"]:
+            if "$match" not in stage and "$sort" not in stage:
+                break
+            leading.append(stage)
+        return database.command("aggregate", shape["collection"], pipeline=leading, explain=True)
+    cursor = collection.find(shape["filter"]).limit(20)
+    if shape.get("sort"):
+        cursor = cursor.sort(shape["sort"])
+    return cursor.explain()
+
+def check_query_plans(database) -> List[str]:
+    """Explain every query shape; returns the failures"""
+    now = datetime.now(timezone.utc)
+    data = seed(database, now)
+    create_indexes(database)
+
+    failures = []
+    for shape in query_shapes(data, now):
+        stages = plan_stages(explain(database, shape))
+        problems = plan_problems(stages)
+        status = "FAIL" if problems else "ok"
+        print(f"{status:4} {shape['collection']}: {shape['name']} [{', '.join(sorted(stages))}]")
+        if problems:
+            failures.append(f"{shape['collection']}: {shape['name']}: {', '.join(problems)}")
+    return failures
+
+def main() -> int:
+    client = MongoClient(QUERY_PLAN_MONGO_URL)
+    client.drop_database(QUERY_PLAN_DB)
+    try:
+        failures = check_query_plans(client[QUERY_PLAN_DB])
+    finally:
+        client.drop_database(QUERY_PLAN_DB)
+    if failures:
+        print(f"{len(failures)} query plan regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("All query plans use indexes without in-memory sorts")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())